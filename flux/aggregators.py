@@ -0,0 +1,143 @@
+ALL_FIELDS = '*'
+
+
+class SumAccumulator:
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        if value is not None:
+            self.value += value
+
+    def merge(self, other):
+        self.value += other.value
+
+    def get_result(self):
+        return self.value
+
+
+class CountAccumulator:
+    def __init__(self):
+        self.value = 0
+
+    def add(self, value):
+        if value is not None:
+            self.value += 1
+
+    def merge(self, other):
+        self.value += other.value
+
+    def get_result(self):
+        return self.value
+
+
+class MinAccumulator:
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def merge(self, other):
+        self.add(other.value)
+
+    def get_result(self):
+        return self.value
+
+
+class MaxAccumulator:
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+    def merge(self, other):
+        self.add(other.value)
+
+    def get_result(self):
+        return self.value
+
+
+class MeanAccumulator:
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.sum += value
+            self.count += 1
+
+    def merge(self, other):
+        self.sum += other.sum
+        self.count += other.count
+
+    def get_result(self):
+        if self.count:
+            return self.sum / self.count
+
+
+class ModeAccumulator:  # memory is O(count of distinct values), not O(count of items)
+    def __init__(self):
+        self.histogram = dict()
+
+    def add(self, value):
+        if value is not None:
+            self.histogram[value] = self.histogram.get(value, 0) + 1
+
+    def merge(self, other):
+        for value, count in other.histogram.items():
+            self.histogram[value] = self.histogram.get(value, 0) + count
+
+    def get_result(self):
+        if self.histogram:
+            return max(self.histogram.items(), key=lambda i: i[1])[0]
+
+
+ACCUMULATORS = dict(
+    sum=SumAccumulator,
+    count=CountAccumulator,
+    cnt=CountAccumulator,
+    min=MinAccumulator,
+    max=MaxAccumulator,
+    mean=MeanAccumulator,
+    avg=MeanAccumulator,
+    mode=ModeAccumulator,
+)
+
+
+def get_descriptions(aggregators):
+    # converts {method: field or list of fields} into list of (field_out, method, field_in)
+    descriptions = list()
+    for method, fields in aggregators.items():
+        if method not in ACCUMULATORS:
+            raise ValueError('Unknown aggregate method: {} (available: {})'.format(method, list(ACCUMULATORS)))
+        if fields is True:
+            fields = ALL_FIELDS
+        for field_in in [fields] if isinstance(fields, str) else fields:
+            field_out = method if field_in == ALL_FIELDS else '{}_{}'.format(method, field_in)
+            descriptions.append((field_out, method, field_in))
+    return descriptions
+
+
+def get_accumulators(descriptions):
+    return [ACCUMULATORS[method]() for _, method, _ in descriptions]
+
+
+def add_record(accumulators, descriptions, record):
+    for a, (_, _, field_in) in zip(accumulators, descriptions):
+        a.add(True if field_in == ALL_FIELDS else record.get(field_in))
+    return accumulators
+
+
+def merge_accumulators(accumulators, other_accumulators):
+    for a, other in zip(accumulators, other_accumulators):
+        a.merge(other)
+    return accumulators
+
+
+def get_results(accumulators, descriptions):
+    return {field_out: a.get_result() for a, (field_out, _, _) in zip(accumulators, descriptions)}
@@ -1,36 +1,38 @@
-from itertools import chain, tee
+from itertools import chain, tee, islice
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import inspect
+import heapq
 import json
 
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
+    from . import spills
+    from . import parallel
+    from . import pipelines
+    from . import routers
+    from . import writers
+    from . import readers
+    from . import samplers
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
+    import spills
+    import parallel
+    import pipelines
+    import routers
+    import writers
+    import readers
+    import samplers
 
 
 def merge_iter(iterables, key_function, reverse=False):
-    iterators_count = len(iterables)
-    finished = [False] * iterators_count
-    take_next = [True] * iterators_count
-    item_from = [None] * iterators_count
-    key_from = [None] * iterators_count
-    choice_function = max if reverse else min
-    while not min(finished):
-        for n in range(iterators_count):
-            if take_next[n] and not finished[n]:
-                try:
-                    item_from[n] = next(iterables[n])
-                    key_from[n] = key_function(item_from[n])
-                    take_next[n] = False
-                except StopIteration:
-                    finished[n] = True
-        if not min(finished):
-            chosen_key = choice_function([k for f, k in zip(finished, key_from) if not f])
-            for n in range(iterators_count):
-                if key_from[n] == chosen_key and not finished[n]:
-                    yield item_from[n]
-                    take_next[n] = True
+    # k-way merge by heap: key of each item is calculated once, equal keys are yielded in order of iterables
+    return heapq.merge(
+        *iterables,
+        key=key_function,
+        reverse=reverse,
+    )
 
 
 class AnyFlux:
@@ -101,9 +103,15 @@ class AnyFlux:
             return i
 
     def expected_count(self):
+        # count of in-memory items is known without iterating of source (lazy steps are applied once if needed)
+        if self.count is None and self.is_in_memory():
+            self.count = len(self.get_list())
         return self.count
 
     def final_count(self):
+        if isinstance(self.items, pipelines.Pipeline) and self.is_in_memory():
+            self.count = len(self.items)
+            return self.count
         result = 0
         for _ in self.items:
             result += 1
@@ -143,7 +151,7 @@ class AnyFlux:
 
     def native_map(self, function):
         return self.__class__(
-            map(function, self.items),
+            pipelines.add_step(self.items, pipelines.StepType.map, function),
             self.count,
         )
 
@@ -160,24 +168,39 @@ class AnyFlux:
             else:
                 return function(i)
         return fx.RecordsFlux(
-            map(get_record, self.items),
+            pipelines.add_step(self.items, pipelines.StepType.map, get_record),
             count=self.count,
             check=True,
         )
 
-    def map(self, function=lambda i: i, to=None):
+    def map(
+            self,
+            function=lambda i: i,
+            to=None,
+            workers=None, executor=parallel.ExecutorType.thread,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
         fx_class = self.get_class(to)
         new_props_keys = fx_class([]).meta().keys()
         props = {k: v for k, v in self.meta().items() if k in new_props_keys}
-        items = map(function, self.items)
-        if self.is_in_memory():
-            items = list(items)
+        if workers:
+            items = parallel.map_items(function, self.items, workers, executor, chunk_size, ordered)
+            if self.is_in_memory():
+                items = list(items)
+        else:
+            items = pipelines.add_step(self.items, pipelines.StepType.map, function)
         return fx_class(
             items,
             **props
         )
 
-    def flat_map(self, function=lambda i: i, to=None):
+    def flat_map(
+            self,
+            function=lambda i: i,
+            to=None,
+            workers=None, executor=parallel.ExecutorType.thread,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
         def get_items():
             for i in self.items:
                 yield from function(i)
@@ -185,12 +208,21 @@ class AnyFlux:
         new_props_keys = fx_class([]).meta().keys()
         props = {k: v for k, v in self.meta().items() if k in new_props_keys}
         props.pop('count')
+        if workers:
+            items = parallel.flat_map_items(function, self.items, workers, executor, chunk_size, ordered)
+        else:
+            items = get_items()
         return fx_class(
-            get_items(),
+            items,
             **props
         )
 
-    def filter(self, *functions):
+    def filter(
+            self,
+            *functions,
+            workers=None, executor=parallel.ExecutorType.thread,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
         def filter_function(item):
             for f in functions:
                 if not f(item):
@@ -198,10 +230,13 @@ class AnyFlux:
             return True
         props = self.meta()
         props.pop('count')
-        filtered_items = filter(filter_function, self.items)
-        if self.is_in_memory():
-            filtered_items = list(filtered_items)
-            props['count'] = len(filtered_items)
+        if workers:
+            filtered_items = parallel.filter_items(functions, self.items, workers, executor, chunk_size, ordered)
+            if self.is_in_memory():
+                filtered_items = list(filtered_items)
+                props['count'] = len(filtered_items)
+        else:  # for in-memory items count will be known after first access
+            filtered_items = pipelines.add_step(self.items, pipelines.StepType.filter, filter_function)
         return self.__class__(
             filtered_items,
             **props
@@ -224,28 +259,62 @@ class AnyFlux:
         )
 
     def take(self, max_count=1):
-        def take_items(m):
-            for n, i in self.enumerated_items():
-                yield i
-                if n + 1 >= m:
-                    break
         props = self.meta()
         props['count'] = min(self.count, max_count) if self.count else None
         return self.__class__(
-            take_items(max_count),
+            pipelines.add_step(self.items, pipelines.StepType.take, max_count),
             **props
         )
 
     def skip(self, count=1):
-        def skip_items(c):
-            for n, i in self.enumerated_items():
-                if n >= c:
-                    yield i
-        next_items = self.items[count:] if self.is_in_memory() else skip_items(count)
         props = self.meta()
-        props['count'] = self.count - count if self.count else None
+        props['count'] = max(self.count - count, 0) if self.count else None
+        return self.__class__(
+            pipelines.add_step(self.items, pipelines.StepType.skip, count),
+            **props
+        )
+
+    def sample(self, n, seed=None):
+        # uniform sample of n items in order of source: sliceable source (list or indexed file) is read
+        # only at sampled positions, other items are passed once with reservoir of n items in memory
+        random_access = pipelines.get_random_access_source(self.items)
+        if random_access:
+            source, steps = random_access
+            positions = samplers.get_sample_positions(len(source), n, seed)
+            items = list(pipelines.execute(samplers.get_items_by_positions(source, positions), steps))
+        else:
+            items = samplers.reservoir_sample(self.items, n, seed)
+        props = self.meta()
+        props['count'] = len(items)
         return self.__class__(
-            next_items,
+            items,
+            **props
+        )
+
+    def sample_fraction(self, fraction, seed=None):
+        # lazy sample with each item taken with probability fraction, items between sampled ones are skipped
+        # by random gaps (read by offsets for sliceable source)
+        random_access = pipelines.get_random_access_source(self.items)
+        if random_access and fraction <= samplers.MAX_FRACTION_BY_POSITIONS:
+            source, steps = random_access
+            positions = samplers.get_fraction_positions(len(source), fraction, seed)
+            items = pipelines.execute(samplers.get_items_by_positions(source, positions), steps)
+        else:
+            items = samplers.bernoulli_sample(self.items, fraction, seed)
+        props = self.meta()
+        props['count'] = None
+        return self.__class__(
+            items,
+            **props
+        )
+
+    def stratified_sample(self, key, n_per_stratum, seed=None):
+        # uniform sample of n_per_stratum items for each value of key(item), memory is O(strata * n_per_stratum)
+        items = samplers.stratified_sample(self.items, key, n_per_stratum, seed)
+        props = self.meta()
+        props['count'] = len(items)
+        return self.__class__(
+            items,
             **props
         )
 
@@ -280,9 +349,9 @@ class AnyFlux:
         )
 
     def add_flux(self, flux, before=False):
-        old_count = self.count
-        new_count = flux.count
-        if old_count is not None or new_count is not None:
+        old_count = self.expected_count()
+        new_count = flux.expected_count()
+        if old_count is not None and new_count is not None:
             total_count = new_count + old_count
         else:
             total_count = None
@@ -321,7 +390,10 @@ class AnyFlux:
         )
 
     def split_by_pos(self, pos):
-        first_flux, second_flux = self.tee(2)
+        if pipelines.is_reiterable(self.items):  # i.e. indexed file or list: slices are read without copies
+            first_flux, second_flux = self, self
+        else:
+            first_flux, second_flux = self.tee(2)
         return (
             first_flux.take(pos),
             second_flux.skip(pos),
@@ -329,7 +401,10 @@ class AnyFlux:
 
     def split_by_list_pos(self, list_pos):
         count_limits = len(list_pos)
-        cloned_fluxes = self.tee(count_limits + 1)
+        if pipelines.is_reiterable(self.items):
+            cloned_fluxes = [self] * (count_limits + 1)
+        else:
+            cloned_fluxes = self.tee(count_limits + 1)
         filtered_fluxes = list()
         prev_pos = 0
         for n, cur_pos in enumerate(list_pos):
@@ -351,19 +426,33 @@ class AnyFlux:
         )
         return filtered_fluxes
 
-    def split_by_numeric(self, func, count):
+    def split_by_numeric(
+            self, func, count,
+            mode=routers.RouteMode.memory,
+            max_buffered=routers.DEFAULT_MAX_BUFFERED,
+            step=routers.DEFAULT_SPILL_STEP,
+            tmp_file_template='split_{}.tmp',
+            spill_manager=None,
+    ):
+        # source is read once and func is called once for each item,
+        # unread items are buffered in memory, in limited queue or in spill files (see routers.RouteMode)
+        if routers.RouteMode(mode) == routers.RouteMode.disk:
+            spill_manager = self.get_spill_manager(tmp_file_template, spill_manager=spill_manager)
+        router = routers.Router(self.items, func, count, mode, max_buffered, step, spill_manager)
+        props = self.meta()
+        props['count'] = None
         return [
-            f.filter(
-                lambda i, n=n: func(i) == n,
-            ) for n, f in enumerate(
-                self.tee(count),
-            )
+            self.__class__(
+                output,
+                **props
+            ) for output in router.get_outputs()
         ]
 
-    def split_by_boolean(self, func):
+    def split_by_boolean(self, func, **kwargs):
         return self.split_by_numeric(
             func=lambda f: int(bool(func(f))),
             count=2,
+            **kwargs
         )
 
     def split(self, by, count=None):
@@ -379,47 +468,120 @@ class AnyFlux:
         else:
             raise TypeError('split(by): by-argument must be int, list, tuple or function, {} received'.format(type(by)))
 
+    def get_spill_manager(
+            self,
+            tmp_file_template=spills.DEFAULT_FILE_TEMPLATE, encoding='utf8',
+            spill_format=spills.DEFAULT_SPILL_FORMAT, compress=False,
+            spill_manager=None,
+    ):
+        if spill_manager is None:
+            spill_manager = spills.SpillManager(
+                template=tmp_file_template,
+                spill_format=spill_format, compress=compress,
+                encoding=encoding,
+            )
+        return spill_manager
+
+    def split_to_files_by_step(
+            self,
+            spill_manager,
+            step=fx.MAX_ITEMS_IN_MEMORY,
+            sort_each_by=None, reverse=False,
+            workers=None,
+            verbose=True,
+    ):
+        # single pass: fills buffer by step items, sorts and spills it, returns list of (filename, count)
+        if workers:
+            return self.split_to_files_by_step_in_parallel(spill_manager, step, sort_each_by, reverse, workers, verbose)
+        iterator = iter(self.items)
+        parts = list()
+        try:
+            while True:
+                part_items = list(islice(iterator, step))
+                if not part_items:
+                    break
+                if sort_each_by is not None:
+                    part_items.sort(key=sort_each_by, reverse=reverse)
+                part_fn, part_count = spill_manager.dump(part_items)
+                if verbose:
+                    print('Part {} sorted and saved into {}'.format(len(parts), part_fn))
+                parts.append((part_fn, part_count))
+        except BaseException:
+            spill_manager.close()
+            raise
+        return parts
+
+    def split_to_files_by_step_in_parallel(
+            self,
+            spill_manager,
+            step=fx.MAX_ITEMS_IN_MEMORY,
+            sort_each_by=None, reverse=False,
+            workers=2,
+            verbose=True,
+    ):
+        # keys are calculated here, so key function can be lambda, parts are sorted and spilled by process pool
+        def wait_for(part_no):
+            part_fn, future = submitted[part_no]
+            part_count = future.result()
+            spill_manager.register(part_fn)
+            if verbose:
+                print('Part {} sorted and saved into {}'.format(part_no, part_fn))
+            parts.append((part_fn, part_count))
+        key_function = sort_each_by or (lambda i: 0)
+        iterator = iter(self.items)
+        submitted, parts = list(), list()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    keyed_items = [(key_function(i), i) for i in islice(iterator, step)]
+                    if not keyed_items:
+                        break
+                    submitted.append(
+                        spill_manager.submit_sorted(executor, keyed_items, reverse),
+                    )
+                    del keyed_items
+                    if len(submitted) - len(parts) > workers:  # bounded count of parts in flight
+                        wait_for(len(parts))
+                while len(parts) < len(submitted):
+                    wait_for(len(parts))
+        except BaseException:
+            spill_manager.close()
+            raise
+        return parts
+
     def split_to_disk_by_step(
             self,
             step=fx.MAX_ITEMS_IN_MEMORY,
             tmp_file_template='split_to_disk_by_step_{}.tmp', encoding='utf8',
             sort_each_by=None, reverse=False,
+            spill_format=spills.DEFAULT_SPILL_FORMAT, compress=False,
+            spill_manager=None,
+            workers=None,
             verbose=True,
     ):
-        count, total_fx = self.count, self
-        if count is None:
-            total_fn = tmp_file_template.format('total')
-            if verbose:
-                print('Collecting input into {}'.format(total_fn))
-            count, total_fx = self.to_json().to_file(
-                total_fn,
-                encoding=encoding,
-            ).map_to_any(
-                json.loads,
-            ).separate_count()
-        part_start, part_no, sorted_parts = 0, None, list()
-        while part_start < count:
-            part_no = int(part_start / step)
-            part_fn = tmp_file_template.format(part_no)
-            if verbose:
-                print('Sorting part {} and saving into {}'.format(part_no, part_fn))
-            part_fx = total_fx.take(step)
-            if sort_each_by is not None:
-                part_fx = part_fx.memory_sort(key=sort_each_by, reverse=reverse)
-            part_fx = part_fx.to_json().to_file(part_fn, encoding=encoding, verbose=verbose).map_to_any(json.loads)
-            sorted_parts.append(part_fx)
-            part_start = part_start + step
+        spill_manager = self.get_spill_manager(tmp_file_template, encoding, spill_format, compress, spill_manager)
+        parts = self.split_to_files_by_step(
+            spill_manager,
+            step=step,
+            sort_each_by=sort_each_by, reverse=reverse,
+            workers=workers,
+            verbose=verbose,
+        )
+        sorted_parts = list()
+        for part_fn, part_count in parts:
+            props = self.meta()
+            props['count'] = part_count
+            sorted_parts.append(
+                self.__class__(
+                    spill_manager.load(part_fn),
+                    **props
+                )
+            )
         return sorted_parts
 
     def split_to_iter_by_step(self, step):
-        def take_items():
-            output_items = list()
-            for n, i in self.enumerated_items():
-                output_items.append(i)
-                if n + 1 >= step:
-                    break
-            return output_items
-        items = take_items()
+        iterator = iter(self.items)
+        items = list(islice(iterator, step))
         props = self.meta()
         while items:
             props['count'] = len(items)
@@ -427,7 +589,7 @@ class AnyFlux:
                 items,
                 **props
             )
-            items = take_items()
+            items = list(islice(iterator, step))
 
     def memory_sort(self, key=lambda i: i, reverse=False):
         sorted_items = sorted(
@@ -448,22 +610,33 @@ class AnyFlux:
             step=fx.MAX_ITEMS_IN_MEMORY,
             tmp_file_template='merge_sort_{}.tmp', encoding='utf8',
             verbose=False,
+            spill_format=spills.DEFAULT_SPILL_FORMAT, compress=False,
+            spill_manager=None,
+            workers=None,
     ):
-        flux_parts = self.split_to_disk_by_step(
+        def get_merged_items():
+            iterables = [spill_manager.load(fn) for fn, _ in parts]
+            try:
+                yield from merge_iter(iterables, key, reverse)
+            finally:  # temporary files are removed when merged items are consumed or closed
+                for i in iterables:
+                    i.close()
+                spill_manager.close()
+        spill_manager = self.get_spill_manager(tmp_file_template, encoding, spill_format, compress, spill_manager)
+        parts = self.split_to_files_by_step(
+            spill_manager,
             step=step,
             sort_each_by=key, reverse=reverse,
-            tmp_file_template=tmp_file_template, encoding=encoding,
+            workers=workers,
             verbose=verbose,
         )
-        assert flux_parts, 'flux must be non-empty'
-        iterables = [f.iterable() for f in flux_parts]
-        counts = [f.count for f in flux_parts]
+        assert parts, 'flux must be non-empty'
         props = self.meta()
-        props['count'] = sum(counts)
+        props['count'] = sum([c for _, c in parts])
         if verbose:
-            print('Merging {} parts...'.format(len(iterables)))
+            print('Merging {} parts...'.format(len(parts)))
         return self.__class__(
-            merge_iter(iterables, key, reverse),
+            get_merged_items(),
             **props
         )
 
@@ -473,6 +646,7 @@ class AnyFlux:
             reverse=False,
             step=fx.MAX_ITEMS_IN_MEMORY, tmp_file_template='merge_sort_{}', encoding='utf8',
             verbose=True,
+            workers=None,
     ):
         keys=fx.update_arg(keys)
         if len(keys) == 0:
@@ -484,13 +658,28 @@ class AnyFlux:
         if self.is_in_memory() or (step is None) or (self.count is not None and self.count <= step):
             return self.memory_sort(key, reverse)
         else:
-            return self.disk_sort(key, reverse, step, tmp_file_template, encoding, verbose)
+            return self.disk_sort(key, reverse, step, tmp_file_template, encoding, verbose, workers=workers)
 
     def get_list(self):
+        if isinstance(self.items, pipelines.Pipeline):
+            items = self.items.get_list()
+            self.count = len(items)
+            return items
         return list(self.items)
 
     def is_in_memory(self):
-        return isinstance(self.items, list)
+        return pipelines.is_in_memory(self.items)
+
+    def explain(self, show=True):
+        # shows how steps over items will be executed: by slice of source and in one loop
+        if isinstance(self.items, pipelines.Pipeline):
+            lines = self.items.explain()
+        else:
+            lines = ['source: {}'.format(pipelines.get_source_name(self.items))]
+        lines = [self.class_name()] + ['    ' + line for line in lines]
+        if show:
+            print('\n'.join(lines))
+        return lines
 
     def to_memory(self):
         items_as_list_in_memory = self.get_list()
@@ -516,6 +705,26 @@ class AnyFlux:
             check=True,
         )
 
+    def to_partitioned_files(
+            self, template, key,
+            partitions_count=None, to_line=str,
+            max_open_files=writers.DEFAULT_MAX_OPEN_FILES, encoding=None,
+    ):
+        # writes items into files by key in one pass, returns list of LinesFlux for partitions 0..partitions_count-1
+        # or dict {value of key: LinesFlux} if partitions_count is not set, counts of fluxes are exact
+        partitions = writers.write_partitions(
+            self.items, key, template,
+            partitions_count, to_line,
+            max_open_files, encoding,
+        )
+        fluxes = OrderedDict(
+            [
+                (p, readers.from_file(f, encoding=encoding, lazy_count=True).update_meta(count=c))
+                for p, (f, c) in partitions.items()
+            ]
+        )
+        return list(fluxes.values()) if partitions_count else fluxes
+
     def to_json(self, **kwargs):
         return self.map_to_any(
             json.dumps
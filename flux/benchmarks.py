@@ -0,0 +1,320 @@
+from random import Random
+from time import perf_counter
+import gzip
+import os
+
+try:  # Assume we're a sub-module in a package.
+    from . import fluxes as fx
+    from . import any_flux as af
+    from . import readers
+    from . import spills
+    from . import pipelines
+    from . import records_flux as rf
+except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
+    import fluxes as fx
+    import any_flux as af
+    import readers
+    import spills
+    import pipelines
+    import records_flux as rf
+
+
+BENCH_SEED = 42
+BENCH_ITEMS_COUNT = 100000
+
+
+def get_time(function, *args, **kwargs):
+    start_time = perf_counter()
+    function(*args, **kwargs)
+    return perf_counter() - start_time
+
+
+def print_times(title, times):
+    print(title)
+    for name, seconds in times:
+        print('    {}: {:.3f}s'.format(name, seconds))
+
+
+def get_sorted_parts(parts_count, items_count=BENCH_ITEMS_COUNT, seed=BENCH_SEED):
+    generator = Random(seed)
+    items = [generator.random() for _ in range(items_count)]
+    step = int(items_count / parts_count) + 1
+    return [sorted(items[n: n + step]) for n in range(0, items_count, step)]
+
+
+def scan_merge_iter(iterables, key_function, reverse=False):  # previous implementation of any_flux.merge_iter()
+    iterators_count = len(iterables)
+    finished = [False] * iterators_count
+    take_next = [True] * iterators_count
+    item_from = [None] * iterators_count
+    key_from = [None] * iterators_count
+    choice_function = max if reverse else min
+    while not min(finished):
+        for n in range(iterators_count):
+            if take_next[n] and not finished[n]:
+                try:
+                    item_from[n] = next(iterables[n])
+                    key_from[n] = key_function(item_from[n])
+                    take_next[n] = False
+                except StopIteration:
+                    finished[n] = True
+        if not min(finished):
+            chosen_key = choice_function([k for f, k in zip(finished, key_from) if not f])
+            for n in range(iterators_count):
+                if key_from[n] == chosen_key and not finished[n]:
+                    yield item_from[n]
+                    take_next[n] = True
+
+
+def bench_merge_iter(parts_counts=(2, 16, 256), items_count=BENCH_ITEMS_COUNT):
+    for parts_count in parts_counts:
+        parts = get_sorted_parts(parts_count, items_count)
+        times = list()
+        for name, merge_function in (('scan', scan_merge_iter), ('heap', af.merge_iter)):
+            iterables = [iter(p) for p in parts]
+            times.append(
+                (name, get_time(lambda: list(merge_function(iterables, lambda i: i)))),
+            )
+        print_times('merge_iter() on {} items from {} parts:'.format(items_count, parts_count), times)
+
+
+def bench_disk_sort_spill_formats(items_count=BENCH_ITEMS_COUNT, parts_count=10, seed=BENCH_SEED):
+    generator = Random(seed)
+    records = [
+        dict(id=n, key=generator.randint(0, items_count), value=generator.random())
+        for n in range(items_count)
+    ]
+    times = list()
+    for spill_format in spills.SpillFormat:
+        times.append(
+            (
+                spill_format.value,
+                get_time(
+                    lambda: readers.from_list(records).to_records().disk_sort(
+                        key=lambda r: r['key'],
+                        step=int(items_count / parts_count) + 1,
+                        tmp_file_template='bench_disk_sort_{}.tmp',
+                        spill_format=spill_format,
+                    ).pass_items()
+                ),
+            )
+        )
+    print_times('disk_sort() on {} records with {} parts:'.format(items_count, parts_count), times)
+
+
+def bench_disk_sort_workers(
+        items_count=BENCH_ITEMS_COUNT, parts_count=10,
+        workers_counts=(None, 2, 4),
+        seed=BENCH_SEED,
+):
+    generator = Random(seed)
+    records = [dict(id=n, key=generator.random()) for n in range(items_count)]
+    times = list()
+    for workers in workers_counts:
+        times.append(
+            (
+                'workers={}'.format(workers),
+                get_time(
+                    lambda: readers.from_list(records).to_records().sort(
+                        'key',
+                        step=int(items_count / parts_count) + 1,
+                        workers=workers,
+                        verbose=False,
+                    ).pass_items()
+                ),
+            )
+        )
+    print_times('RecordsFlux.sort() on {} records with {} parts:'.format(items_count, parts_count), times)
+
+
+def bench_pipeline_steps(items_count=BENCH_ITEMS_COUNT, repeats=5):
+    # per-item overhead of chain of generators vs steps fused into one loop
+    items = list(range(items_count))
+    get_record = lambda i: dict(x=i)  # noqa: E731
+    is_even = lambda r: r['x'] % 2 == 0  # noqa: E731
+    increment = lambda r: dict(x=r['x'] + 1)  # noqa: E731
+
+    def get_generators_chain():
+        records = rf.check_records(map(get_record, items))
+        records = rf.check_records(filter(is_even, records))
+        return list(rf.check_records(map(increment, records)))
+
+    def get_pipeline():
+        pipeline = pipelines.Pipeline(items)
+        for step_type, function in (
+            ('map', get_record), ('check', rf.check_record),
+            ('filter', is_even), ('check', rf.check_record),
+            ('map', increment), ('check', rf.check_record),
+        ):
+            pipeline = pipeline.add_step(step_type, function)
+        return pipeline.get_list()
+    assert get_generators_chain() == get_pipeline()
+    times = list()
+    for name, function in (('generators', get_generators_chain), ('pipeline', get_pipeline)):
+        times.append((name, min([get_time(function) for _ in range(repeats)])))
+    print_times('map/filter/check steps on {} items:'.format(items_count), times)
+    for name, seconds in times:
+        print('    {} per item: {:.3f}us'.format(name, seconds * 1000000 / items_count))
+
+
+def bench_from_file(lines_count=BENCH_ITEMS_COUNT * 10, filename='bench_from_file.tmp', seed=BENCH_SEED):
+    # reading with count of lines before (two passes over file) vs lazy count (one pass)
+    generator = Random(seed)
+    lines = ['{}\t{}'.format(n, generator.random()) for n in range(lines_count)]
+    for gz in (False, True):
+        name = filename + '.gz' if gz else filename
+        with (gzip.open(name, 'wt') if gz else open(name, 'w')) as fh:
+            fh.write('\n'.join(lines))
+        times = list()
+        for lazy_count in (False, True):
+            times.append(
+                (
+                    'lazy_count={}'.format(lazy_count),
+                    get_time(lambda: readers.from_file(name, gz=gz, lazy_count=lazy_count).pass_items()),
+                )
+            )
+        estimated_count = readers.estimate_lines_count(name, gz=gz)
+        title = 'from_file() on {} lines, gz={}, estimated count {}:'.format(lines_count, gz, estimated_count)
+        print_times(title, times)
+        os.remove(name)
+
+
+def write_by_items(lines, filename, end='\n'):  # previous implementation of LinesFlux.to_file()
+    with open(filename, 'w') as fh:
+        for n, i in enumerate(lines):
+            if n > 0:
+                fh.write(end)
+            fh.write(str(i))
+    return readers.from_file(filename, lazy_count=False)
+
+
+def bench_to_file(lines_count=BENCH_ITEMS_COUNT * 10, filename='bench_to_file.tmp', seed=BENCH_SEED):
+    generator = Random(seed)
+    lines = ['{}\t{}'.format(n, generator.random()) for n in range(lines_count)]
+    size_mb = sum(map(len, lines)) / 1024 / 1024
+    times = [
+        ('write by items and count', get_time(lambda: write_by_items(fx.LinesFlux(lines).items, filename))),
+        ('write by batches', get_time(lambda: fx.LinesFlux(lines).to_file(filename, verbose=False))),
+        ('write by batches to gz', get_time(lambda: fx.LinesFlux(lines).to_file(filename + '.gz', verbose=False))),
+    ]
+    print_times('to_file() of {} lines ({:.1f} MB):'.format(lines_count, size_mb), times)
+    for name, seconds in times:
+        print('    {}: {:.1f} MB/s'.format(name, size_mb / seconds))
+    os.remove(filename)
+    os.remove(filename + '.gz')
+
+
+def slice_parquet_rows(parquet):  # previous implementation of readers.from_parquet()
+    for n in range(parquet.num_rows):
+        yield {k: v[0] for k, v in parquet.slice(n, 1).to_pydict().items()}
+
+
+def bench_from_parquet(rows_count=BENCH_ITEMS_COUNT, seed=BENCH_SEED):
+    import pyarrow as pa
+    generator = Random(seed)
+    table = pa.table(
+        dict(
+            id=list(range(rows_count)),
+            key=[generator.randint(0, 100) for _ in range(rows_count)],
+            value=[generator.random() for _ in range(rows_count)],
+        )
+    )
+    times = [
+        ('slice by rows', get_time(lambda: list(slice_parquet_rows(table)))),
+        ('batches', get_time(lambda: readers.from_parquet(table).pass_items())),
+        ('arrow to_pylist()', get_time(table.to_pylist)),
+    ]
+    print_times('from_parquet() on {} rows:'.format(rows_count), times)
+
+
+def bench_select(items_count=BENCH_ITEMS_COUNT, fields_count=50, repeats=3):
+    # projection of few fields from wide records: interpreted descriptions vs compiled function
+    records = [{'f{}'.format(f): n * f for f in range(fields_count)} for n in range(items_count)]
+    descriptions = ('f1', 'f2', ('s', 'f3', 'f4', lambda a, b: a + b), ('t', 's'))
+    compiled_function = rf.get_selector_function(*descriptions)
+    assert rf.select_fields(records[1], *descriptions) == compiled_function(records[1])
+    times = list()
+    for name, function in (
+        ('select_fields', lambda r: rf.select_fields(r, *descriptions)),
+        ('compiled', compiled_function),
+    ):
+        times.append((name, min([get_time(lambda: [function(r) for r in records]) for _ in range(repeats)])))
+    print_times('select() of 4 fields from {} records with {} fields:'.format(items_count, fields_count), times)
+
+
+def bench_parse_csv(lines_count=BENCH_ITEMS_COUNT, seed=BENCH_SEED):
+    generator = Random(seed)
+    schema = [('id', 'int'), ('shop_id', 'int'), ('price', 'float'), ('name', 'str')]
+    lines = [
+        '{},{},{},item {}'.format(n, generator.randint(0, 100), generator.random(), n)
+        for n in range(lines_count)
+    ]
+    times = [
+        ('to_rows().schematize()', get_time(lambda: fx.LinesFlux(lines).to_rows().schematize(schema).pass_items())),
+        ('parse_csv()', get_time(lambda: fx.LinesFlux(lines).parse_csv(schema).pass_items())),
+    ]
+    print_times('CSV of {} lines into SchemaFlux:'.format(lines_count), times)
+
+
+def scan_keys(pairs):  # previous implementation of PairsFlux.keys()
+    my_keys = list()
+    for k, _ in pairs:
+        if k not in my_keys:
+            my_keys.append(k)
+    return my_keys
+
+
+def bench_distinct_keys(
+        keys_counts=(BENCH_ITEMS_COUNT * 10, BENCH_ITEMS_COUNT * 100),
+        scan_keys_count=BENCH_ITEMS_COUNT // 10,
+        seed=BENCH_SEED,
+):
+    # previous list-based keys() is quadratic, so it is measured on smaller count of keys only
+    for keys_count in keys_counts:
+        generator = Random(seed)
+        pairs = [(generator.randrange(keys_count), n) for n in range(keys_count)]
+        times = [
+            ('keys()', get_time(lambda: fx.PairsFlux(pairs).keys())),
+            ('distinct_keys()', get_time(lambda: fx.PairsFlux(pairs).distinct_keys().pass_items())),
+            ('distinct_keys(step)', get_time(
+                lambda: fx.PairsFlux(iter(pairs)).distinct_keys(step=keys_count // 10).pass_items(),
+            )),
+            ('get_dict(of_lists=True)', get_time(lambda: fx.PairsFlux(pairs).get_dict(of_lists=True))),
+        ]
+        if keys_count <= scan_keys_count:
+            times.append(('list scan', get_time(scan_keys, pairs)))
+        print_times('Distinct keys of {} pairs:'.format(keys_count), times)
+    pairs = [(n, n) for n in range(scan_keys_count)]
+    times = [
+        ('keys()', get_time(lambda: fx.PairsFlux(pairs).keys())),
+        ('list scan', get_time(scan_keys, pairs)),
+    ]
+    print_times('Distinct keys of {} pairs:'.format(scan_keys_count), times)
+
+
+def bench_sample(lines_count=BENCH_ITEMS_COUNT * 10, n=1000, filename='bench_sample.tmp', seed=BENCH_SEED):
+    # reservoir over all lines of file vs reading sampled lines by offsets from index of lines
+    fx.LinesFlux([str(i) for i in range(lines_count)]).to_file(filename, verbose=False, return_flux=False)
+    readers.from_file(filename, use_index=True).pass_items()  # index is built before measurement
+    times = [
+        ('take() of head', get_time(lambda: readers.from_file(filename).take(n).get_list())),
+        ('sample() of lines', get_time(lambda: readers.from_file(filename).sample(n, seed=seed))),
+        ('sample() by index', get_time(lambda: readers.from_file(filename, use_index=True).sample(n, seed=seed))),
+    ]
+    os.remove(filename)
+    os.remove(filename + '.idx')
+    print_times('Sample of {} from {} lines of file:'.format(n, lines_count), times)
+
+
+if __name__ == '__main__':
+    bench_merge_iter()
+    bench_disk_sort_spill_formats()
+    bench_disk_sort_workers()
+    bench_pipeline_steps()
+    bench_from_file()
+    bench_to_file()
+    bench_from_parquet()
+    bench_select()
+    bench_parse_csv()
+    bench_distinct_keys()
+    bench_sample()
@@ -0,0 +1,140 @@
+from hashlib import blake2b
+from math import ceil, log
+import numbers
+import struct
+import os
+
+
+DEFAULT_CAPACITY = 1000000  # expected count of distinct keys
+DEFAULT_ERROR_RATE = 0.01  # probability of false positive, ~9.6 bits per key for 1%
+FILTER_SIGNATURE = b'FLBF'
+FILTER_HEADER = struct.Struct('<4sQQQ')  # signature, count of bits, count of hash functions, count of added keys
+
+
+def get_optimal_size(capacity, error_rate=DEFAULT_ERROR_RATE):
+    # returns count of bits and count of hash functions for expected count of keys and rate of false positives
+    capacity = max(capacity, 1)
+    bits_count = ceil(-capacity * log(error_rate) / (log(2) ** 2))
+    hashes_count = max(round(bits_count / capacity * log(2)), 1)
+    return bits_count, hashes_count
+
+
+def get_canonical_number(value):
+    # equal numbers of different types (1, 1.0, True, Decimal('1'), Fraction(2, 2)) have same encoding
+    if isinstance(value, numbers.Complex) and not isinstance(value, numbers.Real):
+        if value.imag:
+            return 'c' + repr(complex(value))
+        value = value.real
+    for function, prefix in ((int, 'i'), (float, 'f')):
+        try:
+            converted = function(value)
+            if converted == value:
+                return prefix + repr(converted)
+        except (ValueError, ArithmeticError):  # int() of nan or infinity, signaling decimal
+            pass
+    return type(value).__name__ + ':' + str(value)
+
+
+def get_canonical_key(key):
+    # text encoding of key: equal keys have equal encodings, so there are no false negatives for keys equal by ==,
+    # supported keys are strings, bytes, numbers, None and tuples of them, other keys are encoded by type and str()
+    if isinstance(key, str):
+        return 's' + key
+    elif isinstance(key, numbers.Number):
+        return get_canonical_number(key)
+    elif isinstance(key, bytes):
+        return 'b' + key.hex()
+    elif isinstance(key, tuple):
+        return '(' + ','.join(map(get_canonical_key, key)) + ')'
+    elif key is None:
+        return 'n'
+    else:
+        return type(key).__name__ + ':' + str(key)
+
+
+def get_key_hashes(key):
+    # keys are hashed by canonical encoding with blake2b, so positions are the same in each run and process
+    value = int.from_bytes(blake2b(get_canonical_key(key).encode('utf8'), digest_size=16).digest(), 'little')
+    return value & 0xFFFFFFFFFFFFFFFF, (value >> 64) | 1
+
+
+def get_capacity(capacity=None, count=None):
+    # filter sized for fewer keys than added has rate of false positives close to 1, so capacity must be known
+    if capacity is None:
+        capacity = count
+    if capacity is None:
+        raise ValueError('capacity of bloom filter must be set for streaming items with unknown count')
+    return capacity
+
+
+class BloomFilter:
+    # compact set of keys without false negatives: key in filter is False only if key was never added,
+    # positions of bits are h1 + i * h2 for two halves of one blake2b digest (double hashing)
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE, bits_count=None, hashes_count=None):
+        if bits_count is None or hashes_count is None:
+            bits_count, hashes_count = get_optimal_size(capacity, error_rate)
+        self.bits_count = bits_count
+        self.hashes_count = hashes_count
+        self.bits = bytearray((bits_count + 7) // 8)
+        self.count = 0
+
+    def get_positions(self, key):
+        h1, h2 = get_key_hashes(key)
+        bits_count = self.bits_count
+        return [(h1 + i * h2) % bits_count for i in range(self.hashes_count)]
+
+    def add(self, key):
+        bits = self.bits
+        for p in self.get_positions(key):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def update(self, keys):
+        for k in keys:
+            self.add(k)
+        return self
+
+    def __contains__(self, key):
+        bits = self.bits
+        for p in self.get_positions(key):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def get_size_in_bytes(self):
+        return len(self.bits)
+
+    def get_error_rate(self):
+        # expected rate of false positives for count of added keys
+        if not self.count:
+            return 0.0
+        return (1 - (1 - 1 / self.bits_count) ** (self.hashes_count * self.count)) ** self.hashes_count
+
+    def save(self, filename):
+        tmp_filename = filename + '.tmp'
+        with open(tmp_filename, 'wb') as fh:
+            fh.write(FILTER_HEADER.pack(FILTER_SIGNATURE, self.bits_count, self.hashes_count, self.count))
+            fh.write(self.bits)
+        os.replace(tmp_filename, filename)
+        return filename
+
+    @staticmethod
+    def load(filename):
+        with open(filename, 'rb') as fh:
+            signature, bits_count, hashes_count, count = FILTER_HEADER.unpack(fh.read(FILTER_HEADER.size))
+            if signature != FILTER_SIGNATURE:
+                raise ValueError('{} is not file of bloom filter'.format(filename))
+            bloom_filter = BloomFilter(bits_count=bits_count, hashes_count=hashes_count)
+            bits = fh.read()
+        if len(bits) != len(bloom_filter.bits):
+            raise ValueError('{} is truncated: {} bytes of {}'.format(filename, len(bits), len(bloom_filter.bits)))
+        bloom_filter.bits = bytearray(bits)
+        bloom_filter.count = count
+        return bloom_filter
+
+
+def from_keys(keys, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+    return BloomFilter(capacity, error_rate).update(keys)
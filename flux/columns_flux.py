@@ -0,0 +1,265 @@
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+try:  # Assume we're a sub-module in a package.
+    from . import fluxes as fx
+    from . import aggregators as ag
+    from . import pipelines
+except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
+    import fluxes as fx
+    import aggregators as ag
+    import pipelines
+
+
+DEFAULT_BATCH_SIZE = 10000  # rows in one batch
+VECTORIZED_METHODS = ('sum', 'count', 'cnt', 'min', 'max', 'mean', 'avg')
+
+
+def is_batch(item):
+    # batch of rows is dict of columns: {field: numpy.ndarray}, all columns have same length
+    if isinstance(item, dict) and all([isinstance(v, np.ndarray) for v in item.values()]):
+        return len(set([len(v) for v in item.values()])) <= 1
+    return False
+
+
+def check_batch(batch, skip_errors=False):
+    if is_batch(batch):
+        return True
+    elif skip_errors:
+        return False
+    else:
+        raise TypeError('check_batches(): this item is not batch of columns: {}'.format(batch))
+
+
+def check_batches(batches, skip_errors=False):
+    for b in batches:
+        if check_batch(b, skip_errors):
+            yield b
+
+
+def get_batch_length(batch):
+    for column in batch.values():
+        return len(column)
+    return 0
+
+
+def get_batch(records, columns=None):
+    columns = columns or list(dict.fromkeys([f for r in records for f in r]))
+    return {f: np.array([r.get(f) for r in records]) for f in columns}
+
+
+def get_records(batch):
+    fields = list(batch)
+    for row in zip(*[batch[f].tolist() for f in fields]):
+        yield dict(zip(fields, row))
+
+
+def concat_batches(batches):
+    batches = list(batches)
+    if not batches:
+        return dict()
+    elif len(batches) == 1:
+        return batches[0]
+    return {f: np.concatenate([b[f] for b in batches]) for f in batches[0]}
+
+
+def split_batch(batch, batch_size=DEFAULT_BATCH_SIZE):
+    length = get_batch_length(batch)
+    for start in range(0, length, batch_size):
+        yield {f: c[start: start + batch_size] for f, c in batch.items()}
+
+
+def get_column(batch, description):
+    # description is name of field or function of batch returning array
+    if callable(description):
+        return np.asarray(description(batch))
+    else:
+        return batch[description]
+
+
+def get_mask(batch, descriptions):
+    mask = np.ones(get_batch_length(batch), dtype=bool)
+    for d in descriptions:
+        mask &= get_column(batch, d).astype(bool)
+    return mask
+
+
+def get_group_codes(batch, keys):
+    # returns columns of unique keys and number of group for each row
+    if len(keys) == 1:
+        unique_keys, codes = np.unique(batch[keys[0]], return_inverse=True)
+        return {keys[0]: unique_keys}, codes.reshape(-1)
+    key_rows = np.rec.fromarrays([batch[k] for k in keys], names=list(keys))
+    unique_keys, codes = np.unique(key_rows, return_inverse=True)
+    return {k: np.asarray(unique_keys[k]) for k in keys}, codes.reshape(-1)
+
+
+def aggregate_column(method, values, codes, groups_count):
+    # each group has rows (codes are from np.unique), except the only group of empty batch
+    if method in ('count', 'cnt'):
+        return np.bincount(codes, minlength=groups_count)
+    elif method in ('mean', 'avg'):
+        counts = np.bincount(codes, minlength=groups_count)
+        return np.bincount(codes, weights=values, minlength=groups_count) / np.maximum(counts, 1)
+    elif not len(values):
+        return np.zeros(groups_count, dtype=values.dtype) if method == 'sum' else np.full(groups_count, None)
+    else:  # sum, min and max keep dtype of values (sum of ints is not converted to float)
+        function = dict(sum=np.add, min=np.minimum, max=np.maximum)[method]
+        order = np.argsort(codes, kind='stable')
+        starts = np.searchsorted(codes[order], np.arange(groups_count))
+        return function.reduceat(values[order], starts)
+
+
+class ColumnsFlux(fx.AnyFlux):
+    # items are batches of rows as dicts of numpy arrays, count is count of batches
+    def __init__(self, items, count=None, check=True):
+        super().__init__(
+            items=pipelines.add_step(items, pipelines.StepType.check, check_batch) if check else items,
+            count=count,
+        )
+        self.check = check
+
+    def meta(self):
+        return dict(
+            count=self.count,
+            check=self.check,
+        )
+
+    @staticmethod
+    def is_valid_item(item):
+        return is_batch(item)
+
+    @staticmethod
+    def valid_items(items, skip_errors=False):
+        return check_batches(items, skip_errors)
+
+    def get_rows_count(self):
+        # streaming batches are collected into memory, so flux can be used after counting
+        if not self.is_in_memory():
+            self.items = self.get_list()
+            self.count = len(self.items)
+        return sum([get_batch_length(b) for b in self.items])
+
+    def columns(self):
+        # first batch of streaming items is read and put back, other batches are not consumed
+        iterator = iter(self.items)
+        for b in iterator:
+            if not self.is_in_memory():
+                self.items = chain([b], iterator)
+            return list(b)
+        return list()
+
+    def select(self, *fields, **expressions):
+        # expressions: new_field=field or new_field=function(batch) returning array
+        def select_columns(batch):
+            selected = {f: batch[f] for f in fields}
+            for f, d in expressions.items():
+                selected[f] = get_column(batch, d)
+            return selected
+        return self.native_map(select_columns)
+
+    def filter(self, *masks):
+        # masks: fields with boolean values or functions of batch returning boolean arrays, empty batches are dropped
+        def filter_batch(batch):
+            mask = get_mask(batch, masks)
+            return {f: c[mask] for f, c in batch.items()}
+        filtered_items = pipelines.add_step(self.items, pipelines.StepType.map, filter_batch)
+        props = self.meta()
+        props['count'] = None
+        return self.__class__(
+            pipelines.add_step(filtered_items, pipelines.StepType.filter, get_batch_length),
+            **props
+        )
+
+    def concat_batches(self):
+        return self.__class__(
+            [concat_batches(self.items)],
+            count=1,
+            check=False,
+        )
+
+    def rebatch(self, batch_size=DEFAULT_BATCH_SIZE):
+        batches = list(split_batch(concat_batches(self.items), batch_size))
+        return self.__class__(
+            batches,
+            count=len(batches),
+            check=False,
+        )
+
+    def sort(self, *keys, reverse=False, batch_size=DEFAULT_BATCH_SIZE):
+        # batches are concatenated in memory and sorted by np.lexsort (stable: rows with equal keys keep their order,
+        # also for reverse sort, which is made by negated ranks of key values)
+        keys = fx.update_arg(keys)
+        batch = concat_batches(self.items)
+        if batch:
+            columns = [batch[k] for k in reversed(keys)]
+            if reverse:
+                columns = [-np.unique(c, return_inverse=True)[1].reshape(-1) for c in columns]
+            order = np.lexsort(columns)
+            batch = {f: c[order] for f, c in batch.items()}
+        batches = list(split_batch(batch, batch_size))
+        return self.__class__(
+            batches,
+            count=len(batches),
+            check=False,
+        )
+
+    def aggregate(self, *keys, **aggregators):
+        # vectorized aggregation of columns of all batches, i.e. aggregate('shop_id', sum='price', count=True),
+        # returns one batch with key fields and fields like sum_price, count
+        keys = fx.update_arg(keys)
+        descriptions = ag.get_descriptions(aggregators)
+        for _, method, _ in descriptions:
+            if method not in VECTORIZED_METHODS:
+                raise ValueError('{} is not supported for columns (available: {})'.format(method, VECTORIZED_METHODS))
+        batch = concat_batches(self.items)
+        if not batch:  # no batches: empty columns of keys and aggregates
+            return self.__class__(
+                [{f: np.array([]) for f in list(keys) + [f for f, _, _ in descriptions]}],
+                count=1,
+                check=False,
+            )
+        length = get_batch_length(batch)
+        if keys:
+            result, codes = get_group_codes(batch, keys)
+        else:
+            result, codes = dict(), np.zeros(length, dtype=np.intp)
+        groups_count = len(list(result.values())[0]) if keys else 1
+        for field_out, method, field_in in descriptions:
+            values = None if field_in == ag.ALL_FIELDS else batch[field_in]
+            result[field_out] = aggregate_column(method, values, codes, groups_count)
+        return self.__class__(
+            [result],
+            count=1,
+            check=False,
+        )
+
+    def get_dataframe(self, columns=None):
+        # columns are passed to pandas without copying when it is possible
+        batch = concat_batches(self.items)
+        if columns:
+            batch = {f: batch[f] for f in columns}
+        return pd.DataFrame(batch, copy=False)
+
+    def to_records(self, **kwargs):
+        def get_records_from_batches():
+            for batch in self.items:
+                yield from get_records(batch)
+        return fx.RecordsFlux(
+            get_records_from_batches(),
+            check=False,
+        )
+
+    def to_columns(self, batch_size=DEFAULT_BATCH_SIZE):
+        return self.rebatch(batch_size)
+
+
+def from_dataframe(dataframe, batch_size=DEFAULT_BATCH_SIZE):
+    # batches are views of columns of dataframe
+    batch = {f: dataframe[f].to_numpy() for f in dataframe.columns}
+    batches = list(split_batch(batch, batch_size))
+    return ColumnsFlux(
+        batches,
+        count=len(batches),
+    )
@@ -11,6 +11,7 @@ try:  # Assume we're a sub-module in a package.
     from .pairs_flux import PairsFlux
     from .schema_flux import SchemaFlux
     from .records_flux import RecordsFlux
+    from .columns_flux import ColumnsFlux
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     from any_flux import AnyFlux
     from lines_flux import LinesFlux
@@ -18,6 +19,7 @@ except ImportError:  # Apparently no higher-level package has been imported, fal
     from pairs_flux import PairsFlux
     from schema_flux import SchemaFlux
     from records_flux import RecordsFlux
+    from columns_flux import ColumnsFlux
 
 
 class FluxType(Enum):
@@ -27,6 +29,7 @@ class FluxType(Enum):
     PairsFlux = 'PairsFlux'
     SchemaFlux = 'SchemaFlux'
     RecordsFlux = 'RecordsFlux'
+    ColumnsFlux = 'ColumnsFlux'
 
 
 def get_class(flux_type):
@@ -45,12 +48,14 @@ def get_class(flux_type):
         return SchemaFlux
     elif flux_type == FluxType.RecordsFlux:
         return RecordsFlux
+    elif flux_type == FluxType.ColumnsFlux:
+        return ColumnsFlux
 
 
 def is_flux(obj):
     return isinstance(
         obj,
-        (AnyFlux, LinesFlux, RowsFlux, PairsFlux, SchemaFlux, RecordsFlux),
+        (AnyFlux, LinesFlux, RowsFlux, PairsFlux, SchemaFlux, RecordsFlux, ColumnsFlux),
     )
 
 
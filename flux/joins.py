@@ -0,0 +1,72 @@
+from itertools import groupby
+from enum import Enum
+
+
+class JoinType(Enum):
+    left = 'left'
+    right = 'right'
+    inner = 'inner'
+    outer = 'outer'
+
+
+def get_sorted_groups(items, key_function, reverse=False, side='left'):
+    # groups items with equal keys and checks that keys are sorted
+    prev_key, is_first = None, True
+    for key, group in groupby(items, key_function):
+        if not is_first and ((key > prev_key) if reverse else (key < prev_key)):
+            raise ValueError('{} items are not sorted by key: {} after {}'.format(side, key, prev_key))
+        prev_key, is_first = key, False
+        yield key, group
+
+
+def merge_join(left, right, left_key, right_key=None, how=JoinType.inner, reverse=False):
+    # streaming join of items sorted by key, yields (left_item, right_item) with None for missing side,
+    # only right items with current key are kept in memory (to join them with each left item with same key)
+    how = JoinType(how)
+    keep_left = how in (JoinType.left, JoinType.outer)
+    keep_right = how in (JoinType.right, JoinType.outer)
+    left_groups = get_sorted_groups(left, left_key, reverse, 'left')
+    right_groups = get_sorted_groups(right, right_key or left_key, reverse, 'right')
+    left_key_value, left_group = next(left_groups, (None, None))
+    right_key_value, right_group = next(right_groups, (None, None))
+    while left_group is not None and right_group is not None:
+        if left_key_value == right_key_value:
+            right_items = list(right_group)
+            for i in left_group:
+                for j in right_items:
+                    yield i, j
+            left_key_value, left_group = next(left_groups, (None, None))
+            right_key_value, right_group = next(right_groups, (None, None))
+        elif (left_key_value > right_key_value) if reverse else (left_key_value < right_key_value):
+            if keep_left:
+                for i in left_group:
+                    yield i, None
+            left_key_value, left_group = next(left_groups, (None, None))
+        else:
+            if keep_right:
+                for j in right_group:
+                    yield None, j
+            right_key_value, right_group = next(right_groups, (None, None))
+    while left_group is not None and keep_left:
+        for i in left_group:
+            yield i, None
+        left_key_value, left_group = next(left_groups, (None, None))
+    while right_group is not None and keep_right:
+        for j in right_group:
+            yield None, j
+        right_key_value, right_group = next(right_groups, (None, None))
+
+
+def merge_values(left, right):
+    # rule of pairs_flux.join_with_dict() (map_side_join) and sorted_join(): fields of right dict are added
+    # to left dict, right list is appended to left list, other left values are kept as is
+    if left is None:
+        return right
+    elif right is None:
+        return left
+    elif isinstance(left, dict) and isinstance(right, dict):
+        return {**left, **right}
+    elif isinstance(left, (list, tuple)) and isinstance(right, (list, tuple)):
+        return list(left) + list(right)
+    else:
+        return left
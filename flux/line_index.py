@@ -0,0 +1,182 @@
+from array import array
+import weakref
+import struct
+import mmap
+import sys
+import os
+
+
+INDEX_EXTENSION = '.idx'
+INDEX_SIGNATURE = b'FLIX'
+INDEX_HEADER = struct.Struct('<4sQQd')  # signature, size of source file, count of lines, mtime of source file
+OFFSET = struct.Struct('<Q')  # offset of line start in source file
+FLUSH_STEP = 1000000  # offsets in memory while building index
+
+
+def get_index_filename(filename):
+    return filename + INDEX_EXTENSION
+
+
+def get_source_state(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime
+
+
+def build_index(filename, index_filename=None):
+    # writes offsets of all lines of source file, returns count of lines
+    index_filename = index_filename or get_index_filename(filename)
+    tmp_filename = index_filename + '.tmp'
+    size, mtime = get_source_state(filename)
+    count, position = 0, 0
+    offsets = array('Q')
+    with open(filename, 'rb') as source, open(tmp_filename, 'wb') as index:
+        index.write(INDEX_HEADER.pack(INDEX_SIGNATURE, size, 0, mtime))
+        for line in source:
+            offsets.append(position)
+            position += len(line)
+            if len(offsets) >= FLUSH_STEP:
+                count += write_offsets(index, offsets)
+                offsets = array('Q')
+        count += write_offsets(index, offsets)
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(INDEX_SIGNATURE, size, count, mtime))
+    os.replace(tmp_filename, index_filename)
+    return count
+
+
+def write_offsets(fh, offsets):
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    offsets.tofile(fh)
+    return len(offsets)
+
+
+def read_header(index_filename):
+    with open(index_filename, 'rb') as fh:
+        data = fh.read(INDEX_HEADER.size)
+    if len(data) == INDEX_HEADER.size:
+        signature, size, count, mtime = INDEX_HEADER.unpack(data)
+        if signature == INDEX_SIGNATURE:
+            return size, count, mtime
+
+
+def is_actual(filename, index_filename=None):
+    # index is actual if it was built for current size and modification time of source file
+    index_filename = index_filename or get_index_filename(filename)
+    if not os.path.exists(index_filename):
+        return False
+    header = read_header(index_filename)
+    if header is None:
+        return False
+    size, _, mtime = header
+    return (size, mtime) == get_source_state(filename)
+
+
+def strip_line_break(line):
+    if line.endswith(b'\r\n'):
+        return line[:-2]
+    elif line.endswith(b'\n') or line.endswith(b'\r'):
+        return line[:-1]
+    return line
+
+
+class LineIndex:
+    # persisted offsets of lines of source file, it is built once and stored next to source file
+    def __init__(self, filename, encoding='utf8', index_filename=None, rebuild=False):
+        self.filename = filename
+        self.encoding = encoding or 'utf8'
+        self.index_filename = index_filename or get_index_filename(filename)
+        if rebuild or not is_actual(filename, self.index_filename):
+            build_index(filename, self.index_filename)
+        _, self.count, _ = read_header(self.index_filename)
+        self.index_map = None
+        self.finalizer = None
+
+    def __len__(self):
+        return self.count
+
+    def get_index_map(self):
+        if self.index_map is None:
+            fh = open(self.index_filename, 'rb')
+            self.index_map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            fh.close()
+            self.finalizer = weakref.finalize(self, self.index_map.close)
+        return self.index_map
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+        self.index_map = None
+        self.finalizer = None
+
+    def get_offset(self, n):
+        if not 0 <= n < self.count:
+            raise IndexError('line {} is out of range of {} lines in {}'.format(n, self.count, self.filename))
+        offset, = OFFSET.unpack_from(self.get_index_map(), INDEX_HEADER.size + n * OFFSET.size)
+        return offset
+
+    def get_line(self, n):
+        for line in self.read_lines(n, n + 1):
+            return line
+        raise IndexError('line {} is out of range of {} lines in {}'.format(n, self.count, self.filename))
+
+    def read_lines(self, start=0, stop=None):
+        # seeks to offset of start line and reads lines until stop line without reading previous lines
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return
+        with open(self.filename, 'rb') as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as source_map:
+                source_map.seek(self.get_offset(start))
+                for _ in range(stop - start):
+                    yield strip_line_break(source_map.readline()).decode(self.encoding)
+
+    def read_positions(self, positions):
+        # reads lines with given numbers by one pass over mmap of source, positions are expected to be sorted
+        with open(self.filename, 'rb') as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as source_map:
+                for n in positions:
+                    source_map.seek(self.get_offset(n))
+                    yield strip_line_break(source_map.readline()).decode(self.encoding)
+
+    def get_lines(self, start=0, stop=None):
+        return IndexedLines(self, start, stop)
+
+
+class IndexedLines:
+    # sliceable and reusable source of lines for pipelines: slices of it are applied by offsets of lines
+    is_sliceable = True
+
+    def __init__(self, index, start=0, stop=None):
+        self.index = index
+        self.start = start
+        self.stop = len(index) if stop is None else min(stop, len(index))
+
+    def __len__(self):
+        return max(self.stop - self.start, 0)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            assert step == 1, 'step of slice is not supported'
+            return IndexedLines(self.index, self.start + start, self.start + max(stop, start))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('line {} is out of range of {} lines'.format(key, len(self)))
+        return self.index.get_line(self.start + key)
+
+    def __iter__(self):
+        return self.index.read_lines(self.start, self.stop)
+
+    def get_position(self, n):
+        # number of line in source file for number of line in this slice
+        if not 0 <= n < len(self):
+            raise IndexError('line {} is out of range of {} lines'.format(n, len(self)))
+        return self.start + n
+
+    def read_positions(self, positions):
+        return self.index.read_positions(map(self.get_position, positions))
+
+    def __repr__(self):
+        return 'lines {}:{} of {}'.format(self.start, self.stop, self.index.filename)
@@ -1,13 +1,19 @@
+from functools import partial
 import sys
-import json
 import csv
 
 try:
     from . import fluxes as fx
+    from . import pipelines
+    from . import parallel
     from . import readers
+    from . import writers
 except ImportError:
     import fluxes as fx
+    import pipelines
+    import parallel
     import readers
+    import writers
 
 max_int = sys.maxsize
 while True:  # To prevent _csv.Error: field larger than field limit (131072)
@@ -22,21 +28,25 @@ def is_line(line):
     return isinstance(line, str)
 
 
+def check_line(line, skip_errors=False):
+    if is_line(line):
+        return True
+    elif skip_errors:
+        return False
+    else:
+        raise TypeError('check_lines(): this item is not a line: {}'.format(line))
+
+
 def check_lines(lines, skip_errors=False):
     for i in lines:
-        if is_line(i):
-            pass
-        elif skip_errors:
-            continue
-        else:
-            raise TypeError('check_lines(): this item is not a line: {}'.format(i))
-        yield i
+        if check_line(i, skip_errors):
+            yield i
 
 
 class LinesFlux(fx.AnyFlux):
     def __init__(self, items, count=None, check=True, source=None):
         super().__init__(
-            check_lines(items) if check else items,
+            pipelines.add_step(items, pipelines.StepType.check, check_line) if check else items,
             count=count,
         )
         self.check = check
@@ -57,59 +67,85 @@ class LinesFlux(fx.AnyFlux):
     def valid_items(items, skip_errors=False):
         return check_lines(items, skip_errors)
 
-    def parse_json(self, default_value=None):
-        def json_loads(line):
-            try:
-                return json.loads(line)
-            except json.JSONDecodeError as err:
-                if default_value is not None:
-                    return default_value
-                else:
-                    raise json.JSONDecodeError(err.msg, err.doc, err.pos)
+    def parse_json(
+            self, default_value=None,
+            workers=None, executor=parallel.ExecutorType.process,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
+        # with workers lines are parsed in pool by chunks,
+        # use readers.from_json_file_in_parallel() to split reading of large file as well
+        if workers:
+            return fx.RecordsFlux(
+                parallel.map_batches(
+                    partial(readers.parse_json_lines, default_value=default_value), self.items,
+                    workers, executor, chunk_size, ordered,
+                ),
+                count=self.count,
+            )
         return self.map_to_records(
-            json_loads,
+            partial(readers.parse_json_line, default_value=default_value),
         ).set_meta(
             count=self.count,
         )
 
-    def lazy_save(self, filename, encoding=None, end='\n', verbose=True, immediately=False):
-        def write_and_yield(fh, lines):
-            n = 0
-            for n, i in enumerate(lines):
-                if n > 0:
-                    fileholder.write(end)
-                fh.write(str(i))
-                yield i
-            fh.close()
-            if verbose:
-                print('Done. {} rows has written into {}'.format(n + 1, filename))
+    def lazy_save(
+            self, filename,
+            encoding=None, end='\n', verbose=True, immediately=False,
+            gz=None, batch_size=writers.DEFAULT_BATCH_SIZE,
+    ):
         if immediately:
-            self.to_file(filename, encoding, end, verbose, return_flux=True)
+            return self.to_file(filename, encoding, end, verbose, return_flux=True, gz=gz, batch_size=batch_size)
         else:
-            fileholder = open(filename, 'w', encoding=encoding) if encoding else open(filename, 'w')
             return LinesFlux(
-                write_and_yield(fileholder, self.items),
+                writers.write_and_yield_lines(self.items, filename, encoding, end, gz, batch_size, verbose),
                 count=self.count,
             )
 
-    def to_file(self, filename, encoding=None, end='\n', verbose=True, return_flux=True):
-        saved_flux = self.lazy_save(filename, encoding, end, verbose, immediately=False)
-        saved_flux.pass_items()
+    def to_file(
+            self, filename,
+            encoding=None, end='\n', verbose=True, return_flux=True,
+            gz=None, batch_size=writers.DEFAULT_BATCH_SIZE,
+    ):
+        # lines are written by blocks, returned flux reads file without counting of lines
+        count = writers.write_lines(self.items, filename, encoding, end, gz, batch_size)
+        if verbose:
+            print('Done. {} rows has written into {}'.format(count, filename))
         if return_flux:
             return readers.from_file(
                 filename,
                 encoding=encoding,
+                gz=gz,
                 verbose=verbose,
+                count=count if end == '\n' else None,
             )
 
-    def to_rows(self, delimiter=None):
+    def to_rows(
+            self, delimiter=None,
+            workers=None, executor=parallel.ExecutorType.process,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
         lines = self.items
-        rows = csv.reader(lines, delimiter=delimiter) if delimiter else csv.reader(lines)
+        if workers:
+            rows = parallel.map_batches(
+                partial(readers.parse_csv_lines, delimiter=delimiter), lines,
+                workers, executor, chunk_size, ordered,
+            )
+        else:
+            rows = csv.reader(lines, delimiter=delimiter) if delimiter else csv.reader(lines)
         return fx.RowsFlux(
             rows,
             self.count,
         )
 
+    def parse_csv(self, schema, delimiter=None, block_size=None, bad_rows=None):
+        # lines are parsed and casted by blocks and columns into typed SchemaFlux,
+        # bad rows are skipped and reported into bad_rows list if it is given, otherwise ValueError is raised
+        return fx.SchemaFlux.from_csv_lines(
+            self.items, schema,
+            delimiter=delimiter, block_size=block_size, bad_rows=bad_rows,
+            count=self.count,
+        )
+
     def to_pairs(self, delimiter=None):
         lines = self.items
         rows = csv.reader(lines, delimiter=delimiter) if delimiter else csv.reader(lines)
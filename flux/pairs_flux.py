@@ -1,9 +1,22 @@
+from itertools import chain, islice, groupby
+from operator import itemgetter
+import heapq
+import sys
+
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
-    from . import readers
+    from . import pipelines
+    from . import spills
+    from . import joins
+    from . import parallel
+    from . import bloom_filter as bf
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
-    import readers
+    import pipelines
+    import spills
+    import joins
+    import parallel
+    import bloom_filter as bf
 
 
 def is_pair(row):
@@ -11,25 +24,97 @@ def is_pair(row):
         return len(row) == 2
 
 
+def check_pair(pair, skip_errors=False):
+    if is_pair(pair):
+        return True
+    elif skip_errors:
+        return False
+    else:
+        raise TypeError('check_pairs(): this item is not pair: {}'.format(pair))
+
+
 def check_pairs(pairs, skip_errors=False):
     for i in pairs:
-        if is_pair(i):
-            pass
-        elif skip_errors:
-            continue
-        else:
-            raise TypeError('check_pairs(): this item is not pair: {}'.format(i))
-        yield i
+        if check_pair(i, skip_errors):
+            yield i
+
+
+RIGHT_ONLY_POSITION = sys.maxsize  # right-only pairs of partitioned join follow all left pairs
 
 
 def get_key(pair):
     return pair[0]
 
 
+def get_distinct_items(items):
+    # yields each item once in order of first appearance, unhashable items are compared with list of seen ones
+    seen, seen_unhashable = set(), list()
+    for i in items:
+        try:
+            if i in seen:
+                continue
+            seen.add(i)
+        except TypeError:
+            if i in seen_unhashable:
+                continue
+            seen_unhashable.append(i)
+        yield i
+
+
+def get_distinct_sorted_items(items):
+    # equal items of sorted iterable are adjacent
+    for i, _ in groupby(items):
+        yield i
+
+
+def join_positioned_with_dict(positioned_pairs, dict_right, how='left', right_position=None):
+    # left pairs are (position, (key, value)), yields (position, (key, joined value)) in order of left pairs,
+    # right dict is added into left dict, right list is appended to left list, other left values are kept;
+    # pairs without right value are dropped by inner join only,
+    # right-only pairs are added after left pairs with right_position for outer join
+    keys_used = set()
+    for position, (key, value) in positioned_pairs:
+        right_part = dict_right.get(key)
+        if how == 'outer':
+            keys_used.add(key)
+        if right_part:
+            if isinstance(value, dict):
+                value.update(right_part)
+            elif isinstance(value, (list, tuple)):
+                value = list(value) + list(right_part)
+        if right_part or not (how == 'inner'):
+            yield position, (key, value)
+    if how == 'outer':
+        for key in dict_right:
+            if key not in keys_used:
+                yield right_position, (key, dict_right[key])
+
+
+def join_with_dict(pairs, dict_right, how='left'):
+    for _, pair in join_positioned_with_dict(enumerate(pairs), dict_right, how):
+        yield pair
+
+
+def join_partitions(arguments, partitions):
+    # can be called in worker process for list of (left filenames, right filenames, output filename) of partitions,
+    # joined pairs with positions of left pairs are dumped into output file, returns list of (filename, count)
+    how, spill_format, compress, encoding = arguments
+    dumped = list()
+    for left_filenames, right_filenames, filename in partitions:
+        dict_right = dict()
+        for f in right_filenames:
+            dict_right.update(spills.load_items(f, spill_format, compress, encoding))
+        left_pairs = chain(*[spills.load_items(f, spill_format, compress, encoding) for f in left_filenames])
+        joined = join_positioned_with_dict(left_pairs, dict_right, how, RIGHT_ONLY_POSITION)
+        count = spills.dump_items(joined, filename, spill_format, compress, encoding=encoding)
+        dumped.append((filename, count))
+    return dumped
+
+
 class PairsFlux(fx.RowsFlux):
     def __init__(self, items, count=None, check=True, secondary=None):
         super().__init__(
-            items=check_pairs(items) if check else items,
+            items=pipelines.add_step(items, pipelines.StepType.check, check_pair) if check else items,
             count=count,
             check=check,
         )
@@ -80,12 +165,19 @@ class PairsFlux(fx.RowsFlux):
             reverse=False,
             step=fx.MAX_ITEMS_IN_MEMORY,
             tmp_file_template='merge_sort_by_key_{}.tmp',
+            spill_format=spills.DEFAULT_SPILL_FORMAT, compress=False,
+            spill_manager=None,
+            workers=None,
     ):
         return self.disk_sort(
             key=get_key,
             reverse=reverse,
             tmp_file_template=tmp_file_template,
             step=step,
+            spill_format=spill_format,
+            compress=compress,
+            spill_manager=spill_manager,
+            workers=workers,
         )
 
     def sorted_group_by_key(self):
@@ -106,36 +198,131 @@ class PairsFlux(fx.RowsFlux):
             fx_groups = fx_groups.to_memory()
         return fx_groups
 
-    def map_side_join(self, right, how='left'):
+    def map_side_join(
+            self, right, how='left',
+            step=fx.MAX_ITEMS_IN_MEMORY,
+            partitions_count=spills.DEFAULT_PARTITIONS_COUNT,
+            spill_manager=None,
+            workers=None,
+            prefilter=False,
+            verbose=True,
+    ):
+        # right side is joined from dict in memory if it has not more than step pairs,
+        # otherwise both sides are spilled into partitions by hash of key and joined partition by partition
+        # (Grace hash join), partitions can be joined in worker processes, joined partitions are merged back
+        # by positions of left pairs, so order of left pairs is kept as in dict join (right-only pairs go last);
+        # with prefilter inner join does not spill left pairs with keys not found in bloom filter of right keys,
+        # prefilter is True (filter is sized by count of right pairs) or capacity of filter for streaming right side
         assert how in ('left', 'right', 'inner', 'outer')
         if isinstance(right, dict):
-            dict_right = right
-        elif isinstance(right, PairsFlux):
-            dict_right = right.get_dict()
-        else:
+            return self.join_with_dict(right, how)
+        elif not isinstance(right, PairsFlux):
             raise TypeError('right must be dict or ParsFlux')
+        if prefilter and how == 'inner':
+            capacity = bf.get_capacity(None if prefilter is True else prefilter, right.expected_count())
+        right_items = iter(right.items)
+        head = list(islice(right_items, step)) if step else list(right_items)
+        tail = list(islice(right_items, 1))
+        if not tail:
+            return self.join_with_dict(PairsFlux(head, check=False).get_dict(), how)
 
         def get_items():
-            keys_used = set()
-            for key, value in self.items:
-                right_part = dict_right.get(key)
-                if how == 'outer':
-                    keys_used.add(key)
-                if right_part:
-                    if isinstance(value, dict):
-                        value.update(right_part)
-                    elif isinstance(value, (list, tuple)):
-                        value = list(value) + list(right_part)
-                if right_part or not (how == 'inner'):
+            manager = self.get_spill_manager('join_{}.tmp', spill_manager=spill_manager)
+            joined_manager = self.get_spill_manager(
+                'joined_{}.tmp', manager.encoding, manager.spill_format, manager.compress,
+            )
+            try:
+                right_pairs = chain(head, tail, right_items)
+                left_pairs = self.items
+                if prefilter and how == 'inner':
+                    right_keys = bf.BloomFilter(capacity)
+                    right_pairs = map(lambda p: right_keys.add(p[0]) or p, right_pairs)
+                    left_pairs = filter(lambda p: p[0] in right_keys, left_pairs)
+                right_partitions = manager.dump_partitions(right_pairs, get_key, partitions_count, step)
+                head.clear()
+                left_partitions = manager.dump_partitions(
+                    enumerate(left_pairs), lambda i: i[1][0], partitions_count, step,
+                )
+                if verbose:
+                    print('Pairs are spilled into {} partitions in {}'.format(partitions_count, manager.path))
+                partitions, inputs = list(), dict()
+                for left_filenames, right_filenames in zip(left_partitions, right_partitions):
+                    filename = joined_manager.get_filename()
+                    partitions.append((left_filenames, right_filenames, filename))
+                    inputs[filename] = left_filenames + right_filenames
+                arguments = (how, joined_manager.spill_format, joined_manager.compress, joined_manager.encoding)
+                if workers:
+                    dumped = parallel.apply_by_chunks(
+                        join_partitions, arguments, partitions,
+                        workers=workers, executor=parallel.ExecutorType.process, chunk_size=1,
+                    )
+                else:
+                    dumped = (d for p in partitions for d in join_partitions(arguments, [p]))
+                joined_filenames = list()
+                for filename, _ in dumped:
+                    joined_manager.register(filename)
+                    joined_filenames.append(filename)
+                    for f in inputs[filename]:
+                        manager.remove(f)
+                # joined partitions are merged by positions of left pairs, so order of left side is kept
+                merged = heapq.merge(*[joined_manager.load(f) for f in joined_filenames], key=itemgetter(0))
+                for _, (key, value) in merged:
                     yield key, value
-            if how == 'outer':
-                for key in dict_right:
-                    if key not in keys_used:
-                        yield key, dict_right[key]
+            finally:
+                manager.close()
+                joined_manager.close()
+        props = self.meta()
+        props.pop('count')
+        return PairsFlux(
+            get_items(),
+            **props
+        )
+
+    def join_with_dict(self, dict_right, how='left'):
+        props = self.meta()
+        props.pop('count')
+        items = join_with_dict(self.items, dict_right, how)
+        return PairsFlux(
+            list(items) if self.is_in_memory() else items,
+            **props
+        )
+
+    def get_bloom_filter(self, capacity=None, error_rate=bf.DEFAULT_ERROR_RATE):
+        # capacity is count of pairs by default (not less than count of distinct keys),
+        # it is required for streaming pairs with unknown count
+        capacity = bf.get_capacity(capacity, self.expected_count())
+        return bf.from_keys(map(get_key, self.items), capacity, error_rate)
+
+    def semi_join(self, right, capacity=None, error_rate=bf.DEFAULT_ERROR_RATE):
+        # keeps pairs with keys found in bloom filter of right keys (or in right BloomFilter, set or dict),
+        # a few pairs without match can pass (false positives), so it is a pre-filter before exact join
+        if isinstance(right, PairsFlux):
+            right = right.get_bloom_filter(capacity, error_rate)
+        props = self.meta()
+        props.pop('count')
+        return self.__class__(
+            pipelines.add_step(self.items, pipelines.StepType.filter, lambda p: p[0] in right),
+            **props
+        )
+
+    def sorted_join(self, right, how='left', reverse=False):
+        # merge join of pairs sorted by key (i.e. by disk_sort_by_key()) without dict of right side in memory,
+        # values with same key are merged by the same rule as in map_side_join() (joins.merge_values()),
+        # each left value is joined with each right value; unlike map_side_join() how='right' keeps right-only pairs
+        # and drops left-only ones, left dicts are not changed in place
+        right_items = right.items if isinstance(right, fx.AnyFlux) else right
+
+        def get_items():
+            for left_pair, right_pair in joins.merge_join(self.items, right_items, get_key, how=how, reverse=reverse):
+                key = get_key(left_pair if left_pair is not None else right_pair)
+                yield key, joins.merge_values(
+                    None if left_pair is None else left_pair[1],
+                    None if right_pair is None else right_pair[1],
+                )
         props = self.meta()
         props.pop('count')
         return PairsFlux(
-            list(get_items()) if self.is_in_memory() else get_items(),
+            get_items(),
             **props
         )
 
@@ -143,14 +330,35 @@ class PairsFlux(fx.RowsFlux):
         return self.secondary_flux()
 
     def keys(self):
-        my_keys = list()
-        for i in self.items:
-            key = get_key(i)
-            if key in my_keys:
-                pass
+        # distinct keys in order of first appearance, only distinct keys are kept in memory
+        return list(get_distinct_items(map(get_key, self.items)))
+
+    def distinct_keys(self, step=None, tmp_file_template='distinct_keys_{}.tmp', verbose=False):
+        # streaming flux of distinct keys in order of first appearance, set of seen keys is kept in memory;
+        # if step is set, keys are sorted by parts of step keys on disk and distinct keys are returned in sorted order
+        if step is None:
+            return fx.AnyFlux(
+                get_distinct_items(map(get_key, self.items)),
+            )
+
+        def get_sorted_keys():
+            keys = iter(map(get_key, self.items))
+            head = list(islice(keys, step))
+            if not head:
+                return
+            tail = list(islice(keys, 1))
+            if tail:
+                keys_flux = fx.AnyFlux(chain(head, tail, keys)).disk_sort(
+                    step=step,
+                    tmp_file_template=tmp_file_template,
+                    verbose=verbose,
+                )
             else:
-                my_keys.append(key)
-        return my_keys
+                keys_flux = fx.AnyFlux(head, count=len(head)).memory_sort()
+            yield from get_distinct_sorted_items(keys_flux.items)
+        return fx.AnyFlux(
+            get_sorted_keys(),
+        )
 
     def extract_keys_in_memory(self):
         flux_for_keys, flux_for_items = self.tee(2)
@@ -159,30 +367,41 @@ class PairsFlux(fx.RowsFlux):
             flux_for_items,
         )
 
-    def extract_keys_on_disk(self, tmp_file_template, encoding='utf8'):
-        filename = tmp_file_template.format('json') if '{}' in tmp_file_template else tmp_file_template
-        self.to_records().to_json().to_file(
-            filename,
-            encoding=encoding,
-        )
+    def extract_keys_on_disk(
+            self,
+            tmp_file_template, encoding='utf8',
+            spill_format=spills.DEFAULT_SPILL_FORMAT, compress=False,
+            spill_manager=None,
+    ):
+        spill_manager = self.get_spill_manager(tmp_file_template, encoding, spill_format, compress, spill_manager)
+        filename, count = spill_manager.dump(self.items, readers=2)
         return (
-            readers.from_file(filename, encoding).to_records().map(lambda r: r.get('key')),
-            readers.from_file(filename, encoding).to_records().to_pairs('key', 'value'),
+            fx.AnyFlux(spill_manager.load(filename), count=count).map(get_key),
+            PairsFlux(spill_manager.load(filename), count=count, secondary=self.secondary),
         )
 
-    def extract_keys(self, tmp_file_template=None):
+    def extract_keys(self, tmp_file_template=None, spill_format=spills.DEFAULT_SPILL_FORMAT):
         if tmp_file_template is None:
             return self.extract_keys_in_memory()
         else:
-            return self.extract_keys_on_disk(tmp_file_template)
+            return self.extract_keys_on_disk(tmp_file_template, spill_format=spill_format)
 
     def get_dict(self, of_lists=False):
         result = dict()
         if of_lists:
+            seen = set()  # hashable (key, value) pairs, unhashable values are searched in list of key
             for k, v in self.items:
-                distinct = result.get(k, [])
-                if v not in distinct:
-                    result[k] = distinct + [v]
+                values = result.get(k)
+                if values is None:
+                    values = result[k] = list()
+                try:
+                    if (k, v) in seen:
+                        continue
+                    seen.add((k, v))
+                except TypeError:
+                    if v in values:
+                        continue
+                values.append(v)
         else:
             for k, v in self.items:
                 result[k] = v
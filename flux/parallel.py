@@ -0,0 +1,102 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from collections import deque
+from enum import Enum
+
+
+DEFAULT_CHUNK_SIZE = 1000
+CHUNKS_PER_WORKER = 2  # limit of chunks in flight for each worker
+
+
+class ExecutorType(Enum):
+    process = 'process'  # functions and items must be picklable (no lambdas), it is opt-in for CPU-bound functions
+    thread = 'thread'  # default: works with any functions
+
+
+def get_executor(workers, executor=ExecutorType.thread):
+    executor = ExecutorType(executor)
+    if executor == ExecutorType.process:
+        return ProcessPoolExecutor(max_workers=workers)
+    elif executor == ExecutorType.thread:
+        return ThreadPoolExecutor(max_workers=workers)
+
+
+def map_chunk(function, chunk):
+    return [function(i) for i in chunk]
+
+
+def apply_to_chunk(function, chunk):
+    return function(chunk)
+
+
+def flat_map_chunk(function, chunk):
+    return [j for i in chunk for j in function(i)]
+
+
+def filter_chunk(functions, chunk):
+    return [i for i in chunk if all(f(i) for f in functions)]
+
+
+def get_chunks(items, chunk_size=DEFAULT_CHUNK_SIZE):
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def pop_done(in_flight, ordered=True):
+    if ordered:
+        return [in_flight.popleft()]
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        in_flight.remove(future)
+    return done
+
+
+def apply_by_chunks(
+        chunk_function, argument, items,
+        workers=2, executor=ExecutorType.thread,
+        chunk_size=DEFAULT_CHUNK_SIZE, ordered=True,
+):
+    # chunk_function(argument, chunk) is called in pool, results are streamed with bounded count of chunks in flight
+    max_in_flight = workers * CHUNKS_PER_WORKER
+    with get_executor(workers, executor) as pool:
+        in_flight = deque()
+        for chunk in get_chunks(items, chunk_size):
+            in_flight.append(pool.submit(chunk_function, argument, chunk))
+            if len(in_flight) >= max_in_flight:
+                for future in pop_done(in_flight, ordered):
+                    yield from future.result()
+        while in_flight:
+            for future in pop_done(in_flight, ordered):
+                yield from future.result()
+
+
+def map_items(function, items, workers=2, executor=ExecutorType.thread, chunk_size=DEFAULT_CHUNK_SIZE, ordered=True):
+    return apply_by_chunks(map_chunk, function, items, workers, executor, chunk_size, ordered)
+
+
+def map_batches(
+        function, items,
+        workers=2, executor=ExecutorType.thread,
+        chunk_size=DEFAULT_CHUNK_SIZE, ordered=True,
+):
+    # function gets list of items (chunk) and returns list of results
+    return apply_by_chunks(apply_to_chunk, function, items, workers, executor, chunk_size, ordered)
+
+
+def flat_map_items(
+        function, items,
+        workers=2, executor=ExecutorType.thread,
+        chunk_size=DEFAULT_CHUNK_SIZE, ordered=True,
+):
+    return apply_by_chunks(flat_map_chunk, function, items, workers, executor, chunk_size, ordered)
+
+
+def filter_items(
+        functions, items,
+        workers=2, executor=ExecutorType.thread,
+        chunk_size=DEFAULT_CHUNK_SIZE, ordered=True,
+):
+    return apply_by_chunks(filter_chunk, tuple(functions), items, workers, executor, chunk_size, ordered)
@@ -0,0 +1,253 @@
+from itertools import islice
+from enum import Enum
+
+
+class StepType(Enum):
+    map = 'map'
+    filter = 'filter'
+    check = 'check'  # validation of item: returns True or raises error (or returns False if errors are skipped)
+    take = 'take'
+    skip = 'skip'
+
+
+ONE_TO_ONE_STEPS = (StepType.map, StepType.check)  # take- and skip-steps can be moved upstream through these steps
+COMPILED_FUNCTIONS = dict()
+
+
+def get_step_name(step):
+    step_type, argument = step
+    if isinstance(argument, int):
+        description = argument
+    else:
+        description = getattr(argument, '__name__', None) or repr(argument)
+    return '{}({})'.format(step_type.value, description)
+
+
+def is_sliceable(source):
+    # list or reusable source supporting slices without reading of skipped items (i.e. line_index.IndexedLines)
+    return isinstance(source, list) or getattr(source, 'is_sliceable', False)
+
+
+def get_source_name(source):
+    if isinstance(source, list):
+        return 'list of {} items'.format(len(source))
+    elif is_sliceable(source):
+        return 'sliceable {}'.format(source)
+    else:
+        return 'iterator {}'.format(type(source).__name__)
+
+
+def optimized(steps):
+    # pushes take- and skip-steps upstream through one-to-one steps, joins adjacent take- and skip-steps,
+    # so skipped items are not transformed and validated
+    steps = list(steps)
+    changed = True
+    while changed:
+        changed = False
+        for n in range(1, len(steps)):
+            (prev_type, prev_argument), (cur_type, cur_argument) = steps[n - 1], steps[n]
+            if cur_type in (StepType.take, StepType.skip) and prev_type in ONE_TO_ONE_STEPS:
+                steps[n - 1], steps[n] = steps[n], steps[n - 1]
+            elif cur_type == prev_type == StepType.take:
+                steps[n - 1: n + 1] = [(StepType.take, min(prev_argument, cur_argument))]
+            elif cur_type == prev_type == StepType.skip:
+                steps[n - 1: n + 1] = [(StepType.skip, prev_argument + cur_argument)]
+            else:
+                continue
+            changed = True
+            break
+    return steps
+
+
+def sliced(source, steps):
+    # applies leading take- and skip-steps to source by slice
+    steps = list(steps)
+    while steps and steps[0][0] in (StepType.take, StepType.skip):
+        step_type, argument = steps.pop(0)
+        if step_type == StepType.take:
+            source = source[:argument] if is_sliceable(source) else islice(source, argument)
+        else:
+            source = source[argument:] if is_sliceable(source) else islice(source, argument, None)
+    return source, steps
+
+
+def get_compiled_function(step_types):
+    # generates code of one loop for given sequence of steps and caches it
+    step_types = tuple(step_types)
+    if step_types not in COMPILED_FUNCTIONS:
+        lines = ['def execute(items, arguments):']
+        for n, step_type in enumerate(step_types):
+            lines.append('    a{n} = arguments[{n}]'.format(n=n))
+            if step_type in (StepType.take, StepType.skip):
+                lines.append('    c{} = 0'.format(n))
+            if step_type == StepType.take:
+                lines += ['    if a{} <= 0:'.format(n), '        return']
+        lines += ['    stop = False', '    for i in items:']
+        next_item = ['continue']
+        for n, step_type in enumerate(step_types):
+            if step_type == StepType.map:
+                lines.append('        i = a{}(i)'.format(n))
+            elif step_type in (StepType.filter, StepType.check):
+                lines.append('        if not a{}(i):'.format(n))
+                lines += ['            ' + line for line in next_item]
+            elif step_type == StepType.skip:
+                lines += ['        if c{n} < a{n}:'.format(n=n), '            c{} += 1'.format(n)]
+                lines += ['            ' + line for line in next_item]
+            elif step_type == StepType.take:  # stops after last item without taking next one from source
+                lines += ['        c{} += 1'.format(n), '        if c{n} >= a{n}:'.format(n=n)]
+                lines.append('            stop = True')
+                next_item = ['if stop:', '    return', 'continue']
+        lines.append('        yield i')
+        if len(next_item) > 1:
+            lines += ['        ' + line for line in next_item[:2]]
+        namespace = dict()
+        exec('\n'.join(lines), namespace)
+        COMPILED_FUNCTIONS[step_types] = namespace['execute']
+    return COMPILED_FUNCTIONS[step_types]
+
+
+def execute(items, steps):
+    # applies all steps to each item in one loop instead of chain of generators or intermediate lists
+    source, steps = sliced(items, optimized(steps))
+    if not steps:
+        return iter(source)
+    compiled_function = get_compiled_function([t for t, _ in steps])
+    return compiled_function(source, [a for _, a in steps])
+
+
+class Pipeline:
+    # logical plan of steps over source items: list (lazy in-memory items, executed once on first access)
+    # or iterator (streaming items, executed in one loop while iterating)
+    def __init__(self, source, steps=tuple()):
+        self.source = source
+        self.steps = tuple(steps)
+        self.result = None
+        self.iterator = None
+
+    def is_materialized(self):
+        return self.result is not None
+
+    def is_in_memory(self):
+        return self.is_materialized() or isinstance(self.source, list)
+
+    def is_one_shot(self):
+        # iterator source can be read once, so steps over it are executed once and partly read items are not repeated
+        return not self.is_materialized() and not is_sliceable(self.source)
+
+    def get_iterator(self):
+        if not self.is_one_shot():
+            return execute(self.source, self.steps)
+        if self.iterator is None:
+            self.iterator = execute(self.source, self.steps)
+        return self.iterator
+
+    def add_step(self, step_type, argument):
+        step_type = StepType(step_type)
+        if self.is_materialized():
+            source, steps = self.result, tuple()
+        elif self.iterator is not None:  # next steps continue started loop with its counters of take and skip
+            source, steps = self.iterator, tuple()
+        else:
+            source, steps = self.source, self.steps
+        if step_type == StepType.check and self.has_check(argument):
+            return Pipeline(source, steps)
+        return Pipeline(source, steps + ((step_type, argument), ))
+
+    def has_check(self, function):
+        # validation is redundant if same check was applied and items were not changed after that
+        for step_type, argument in reversed(self.steps):
+            if step_type == StepType.check and argument is function:
+                return True
+            elif step_type == StepType.map:
+                return False
+        return False
+
+    def get_list(self):
+        if not self.is_materialized():
+            self.result = list(self.get_iterator())
+            self.source, self.steps, self.iterator = None, tuple(), None
+        return self.result
+
+    def get_count(self):
+        if self.is_materialized():
+            return len(self.result)
+
+    def explain(self):
+        source = self.result if self.is_materialized() else self.source
+        steps = optimized(self.steps)
+        _, loop_steps = sliced([], steps)
+        slice_steps = steps[:len(steps) - len(loop_steps)]
+        return [
+            'source: {}'.format(get_source_name(source)),
+            'steps: {}'.format(' -> '.join([get_step_name(s) for s in self.steps]) or '-'),
+            'slice of source: {}'.format(' -> '.join([get_step_name(s) for s in slice_steps]) or '-'),
+            'one loop: {}'.format(' -> '.join([get_step_name(s) for s in loop_steps]) or '-'),
+        ]
+
+    def __iter__(self):
+        if self.is_in_memory():
+            return iter(self.get_list())
+        else:
+            return self.get_iterator()
+
+    def __next__(self):
+        if not self.is_one_shot():
+            raise TypeError('Pipeline over reusable source is not an iterator')
+        return next(self.get_iterator())
+
+    def __len__(self):
+        # streaming pipeline is not materialized implicitly, count it by iterating
+        if not self.is_in_memory():
+            raise TypeError('len() of streaming Pipeline is unknown before iterating')
+        return len(self.get_list())
+
+    def __getitem__(self, key):
+        if not self.is_in_memory():
+            raise TypeError('streaming Pipeline does not support indexing')
+        return self.get_list()[key]
+
+    def __repr__(self):
+        return 'Pipeline({} steps: {})'.format(
+            len(self.steps),
+            ', '.join([get_step_name(s) for s in self.steps]),
+        )
+
+
+def get_random_access_source(items):
+    # returns sliceable source (with leading take- and skip-steps applied) and remaining one-to-one steps,
+    # so n-th item can be read without previous items, returns None if other steps or source do not allow it
+    if isinstance(items, Pipeline):
+        if items.is_materialized():
+            return items.result, tuple()
+        if not is_sliceable(items.source):
+            return None
+        source, steps = sliced(items.source, optimized(items.steps))
+    else:
+        source, steps = items, tuple()
+    if is_sliceable(source) and all([t in ONE_TO_ONE_STEPS for t, _ in steps]):
+        return source, steps
+
+
+def add_step(items, step_type, argument):
+    if isinstance(items, Pipeline):
+        return items.add_step(step_type, argument)
+    else:
+        return Pipeline(items, [(StepType(step_type), argument)])
+
+
+def is_reiterable(items):
+    # items can be iterated again with same result and without repeated calls of functions
+    if isinstance(items, Pipeline):
+        if items.is_materialized():
+            return True
+        user_steps = [t for t, _ in items.steps if t in (StepType.map, StepType.filter)]
+        return is_sliceable(items.source) and not user_steps
+    else:
+        return is_sliceable(items)
+
+
+def is_in_memory(items):
+    if isinstance(items, Pipeline):
+        return items.is_in_memory()
+    else:
+        return isinstance(items, list)
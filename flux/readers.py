@@ -1,12 +1,29 @@
+from functools import partial
 import gzip
+import json
+import csv
+import io
+import os
 
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
+    from . import parallel
+    from . import line_index
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
+    import parallel
+    import line_index
+
+try:  # pyarrow is optional, it is required for from_parquet() only
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
 
 
 VERBOSE_STEP = 10000
+ESTIMATE_SAMPLE_BYTES = 1024 * 1024
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+DEFAULT_PARQUET_BATCH_SIZE = 65536
 
 
 def iterable(any_iterable):
@@ -23,54 +40,101 @@ def from_list(input_list):
     )
 
 
-def count_lines(filename, encoding=None, gz=False, chunk_size=8192):
+def open_file(filename, encoding=None, gz=False):
     if gz:
-        fileholder = gzip.open(filename, 'r')
+        return gzip.open(filename, 'rt', encoding=encoding)
     else:
-        fileholder = open(filename, 'r', encoding=encoding) if encoding else open(filename, 'r')
+        return open(filename, 'r', encoding=encoding) if encoding else open(filename, 'r')
+
+
+def count_lines(filename, encoding=None, gz=False, chunk_size=8192):
+    fileholder = open_file(filename, encoding, gz)
     count_n = sum(chunk.count('\n') for chunk in iter(lambda: fileholder.read(chunk_size), ''))
     fileholder.close()
     return count_n + 1
 
 
+def estimate_lines_count(filename, gz=False, sample_size=ESTIMATE_SAMPLE_BYTES):
+    # by file size and count of line breaks in first bytes of file (decompressed for gz)
+    fileholder = gzip.open(filename, 'rb') if gz else open(filename, 'rb')
+    sample = fileholder.read(sample_size)
+    read_bytes = fileholder.fileobj.tell() if gz else len(sample)
+    fileholder.close()
+    if len(sample) < sample_size:  # whole file is in sample
+        return sample.count(b'\n') + 1
+    return int(sample.count(b'\n') * os.path.getsize(filename) / read_bytes)
+
+
+def get_read_bytes(fileholder):
+    # position in file on disk (compressed for gz) while iterating over lines of text
+    raw = fileholder.buffer
+    return raw.fileobj.tell() if isinstance(raw, gzip.GzipFile) else raw.tell()
+
+
 def from_file(
         filename,
-        encoding=None, gz=False,
+        encoding=None, gz=None,
         skip_first_line=False, max_n=None,
         verbose=False, step_n=VERBOSE_STEP,
+        lazy_count=None, estimate_count=False,
+        use_index=False, count=None,
 ):
-    def lines_from_fileholder(fh, count, verbose, step_n, rstrip='\n'):
+    # lazy_count: file is read once without counting lines before, count of flux is unknown (None),
+    # progress is shown by position in file, estimate_count adds estimated count of lines to progress,
+    # count: known count of lines (i.e. just written), file is not counted
+    if gz is None:
+        gz = filename.endswith('.gz')
+    if use_index:
+        return from_indexed_file(filename, encoding, skip_first_line, max_n, verbose)
+    if lazy_count is None:
+        lazy_count = gz
+
+    def lines_from_fileholder(fh, count, expected_count, verbose, step_n, rstrip='\n'):
+        file_size = os.path.getsize(filename)
+        limit = count or max_n
+        n = -1
         for n, row in enumerate(fh):
             if verbose:
-                if (n % step_n == 0) or (n + 1 >= count):
+                if count and ((n % step_n == 0) or (n + 1 >= count)):
                     percent = int(100 * (n + 1) / count)
                     print('{}% ({}/{}) lines processed'.format(percent, n + 1, count), end='\r')
+                elif not count and n % step_n == 0:
+                    percent = int(100 * get_read_bytes(fh) / file_size) if file_size else 100
+                    expected = '/~{}'.format(expected_count) if expected_count else ''
+                    print('{}% ({}{}) lines processed'.format(percent, n + 1, expected), end='\r')
             if rstrip:
                 row = row.rstrip(rstrip)
             yield row
-            if count and (n + 1 == count):
+            if limit and (n + 1 == limit):
                 break
         if verbose:
             print(' ' * 80, end='\r')
-            print('Done. {} lines processed'.format(count))
+            print('Done. {} lines processed'.format(n + 1))
             print('')
         fh.close()
 
-    if verbose:
-        print('Checking', filename, end='\r')
-    lines_count = count_lines(filename, encoding, gz)
-    if max_n and max_n < lines_count:
-        lines_count = max_n
+    if count is not None:
+        lines_count = min(count, max_n) if max_n else count
+        expected_lines_count = lines_count
+    elif lazy_count:
+        lines_count = None
+        expected_lines_count = estimate_lines_count(filename, gz) if estimate_count else None
+        if expected_lines_count and max_n:
+            expected_lines_count = min(expected_lines_count, max_n)
+    else:
+        if verbose:
+            print('Checking', filename, end='\r')
+        lines_count = count_lines(filename, encoding, gz)
+        if max_n and max_n < lines_count:
+            lines_count = max_n
+        expected_lines_count = lines_count
     if verbose:
         print(' ' * 80, end='\r')
         print(verbose if isinstance(verbose, str) else 'Reading file:', filename)
-    if gz:
-        fileholder = gzip.open(filename, 'r')
-    else:
-        fileholder = open(filename, 'r', encoding=encoding) if encoding else open(filename, 'r')
+    fileholder = open_file(filename, encoding, gz)
 
     flux_from_file = fx.LinesFlux(
-        lines_from_fileholder(fileholder, lines_count, verbose, step_n),
+        lines_from_fileholder(fileholder, lines_count, expected_lines_count, verbose, step_n),
         lines_count,
         source=filename,
     )
@@ -79,13 +143,162 @@ def from_file(
     return flux_from_file
 
 
-def from_parquet(parquet):
+def from_indexed_file(filename, encoding=None, skip_first_line=False, max_n=None, verbose=False):
+    # index of line offsets is built once and stored next to file (filename.idx),
+    # then skip(), take() and split_by_pos() seek to offsets of lines instead of reading previous lines
+    if filename.endswith('.gz'):
+        raise ValueError('index of lines can not be used for gz file: {}'.format(filename))
+    if verbose:
+        print('Checking index of', filename, end='\r')
+    index = line_index.LineIndex(filename, encoding)
+    if verbose:
+        print(' ' * 80, end='\r')
+        print(verbose if isinstance(verbose, str) else 'Reading file:', filename)
+    lines = index.get_lines(stop=max_n)
+    flux_from_file = fx.LinesFlux(
+        lines,
+        len(lines),
+        source=filename,
+    )
+    if skip_first_line:
+        flux_from_file = flux_from_file.skip(1)
+    return flux_from_file
+
+
+def parse_json_line(line, default_value=None):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as err:
+        if default_value is not None:
+            return default_value
+        else:
+            raise json.JSONDecodeError(err.msg, err.doc, err.pos)
+
+
+def parse_json_lines(lines, default_value=None):
+    return [parse_json_line(i, default_value) for i in lines]
+
+
+def parse_csv_lines(lines, delimiter=None):
+    return list(csv.reader(lines, delimiter=delimiter) if delimiter else csv.reader(lines))
+
+
+def get_byte_ranges(filename, chunk_bytes=DEFAULT_CHUNK_BYTES, skip_first_line=False):
+    # splits plain text file into ranges (start, end) of about chunk_bytes, each range ends after line break
+    if filename.endswith('.gz'):
+        raise ValueError('gz file can not be split into byte ranges: {}'.format(filename))
+    file_size = os.path.getsize(filename)
+    byte_ranges = list()
+    with open(filename, 'rb') as fh:
+        start = len(fh.readline()) if skip_first_line else 0
+        while start < file_size:
+            if start + chunk_bytes >= file_size:
+                end = file_size
+            else:
+                fh.seek(start + chunk_bytes - 1)
+                fh.readline()
+                end = fh.tell()
+            byte_ranges.append((start, end))
+            start = end
+    return byte_ranges
+
+
+def read_lines_range(filename, start, end, encoding='utf8'):
+    with open(filename, 'rb') as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+    return [i.rstrip('\n') for i in io.StringIO(data.decode(encoding), newline=None)]
+
+
+def parse_ranges(arguments, byte_ranges):
+    # is called in worker process: reads and parses lines from given ranges of file
+    filename, encoding, parser = arguments
+    parsed_items = list()
+    for start, end in byte_ranges:
+        lines = read_lines_range(filename, start, end, encoding)
+        parsed_items += parser(lines) if parser else lines
+    return parsed_items
+
+
+def from_file_by_chunks(filename, encoding='utf8', chunk_bytes=DEFAULT_CHUNK_BYTES, skip_first_line=False):
+    # returns list of LinesFlux for ranges of file aligned to line breaks, ranges are read on demand
+    def lines_from_range(start, end):
+        yield from read_lines_range(filename, start, end, encoding)
+    return [
+        fx.LinesFlux(lines_from_range(start, end), source=filename)
+        for start, end in get_byte_ranges(filename, chunk_bytes, skip_first_line)
+    ]
+
+
+def from_file_in_parallel(
+        filename, parser=None,
+        to='LinesFlux',
+        encoding='utf8', chunk_bytes=DEFAULT_CHUNK_BYTES, skip_first_line=False,
+        workers=2, executor=parallel.ExecutorType.process, ordered=True,
+):
+    # ranges of file are read and parsed in worker processes, parser gets list of lines and returns list of items,
+    # i.e. parse_json_lines for RecordsFlux or partial(parse_csv_lines, delimiter='\t') for RowsFlux
+    items = parallel.apply_by_chunks(
+        parse_ranges, (filename, encoding, parser),
+        get_byte_ranges(filename, chunk_bytes, skip_first_line),
+        workers, executor,
+        chunk_size=1, ordered=ordered,
+    )
+    return fx.get_class(fx.FluxType(to))(items)
+
+
+def from_json_file_in_parallel(filename, default_value=None, **kwargs):
+    return from_file_in_parallel(
+        filename, partial(parse_json_lines, default_value=default_value),
+        to='RecordsFlux',
+        **kwargs
+    )
+
+
+def get_row_groups(parquet_file, row_groups=None):
+    # row_groups: list of numbers of row groups or function filtering metadata of row group (i.e. by statistics)
+    if callable(row_groups):
+        metadata = parquet_file.metadata
+        return [n for n in range(metadata.num_row_groups) if row_groups(metadata.row_group(n))]
+    elif row_groups is None:
+        return list(range(parquet_file.metadata.num_row_groups))
+    else:
+        return list(row_groups)
+
+
+def get_parquet_batches(parquet, columns=None, row_groups=None, batch_size=DEFAULT_PARQUET_BATCH_SIZE):
+    # parquet can be filename, pyarrow.parquet.ParquetFile or pyarrow.Table, returns (batches, count of rows)
+    if hasattr(parquet, 'to_batches'):  # pyarrow.Table
+        assert row_groups is None, 'row_groups can be used for parquet file only'
+        table = parquet.select(columns) if columns else parquet
+        return table.to_batches(max_chunksize=batch_size), table.num_rows
+    if pq is None:
+        raise ImportError('pyarrow is required for reading parquet files')
+    parquet_file = parquet if isinstance(parquet, pq.ParquetFile) else pq.ParquetFile(parquet)
+    row_groups = get_row_groups(parquet_file, row_groups)
+    count = sum([parquet_file.metadata.row_group(n).num_rows for n in row_groups])
+    if not row_groups:
+        return [], count
+    batches = parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns)
+    return batches, count
+
+
+def from_parquet(
+        parquet,
+        columns=None, row_groups=None,
+        batch_size=DEFAULT_PARQUET_BATCH_SIZE,
+        as_batches=False,
+):
+    # records are converted from arrow by batches,
+    # as_batches returns AnyFlux of pyarrow.RecordBatch objects without conversion to python objects
+    batches, count = get_parquet_batches(parquet, columns, row_groups, batch_size)
+    if as_batches:
+        return fx.AnyFlux(batches)
+
     def get_records():
-        for n in range(parquet.num_rows):
-            yield parquet.slice(n, 1).to_pydict()
+        for batch in batches:
+            yield from batch.to_pylist()
     return fx.RecordsFlux(
         items=get_records(),
-        count=parquet.num_rows,
-    ).map(
-        lambda r: {k: v[0] for k, v in r.items()}
+        count=count,
     )
@@ -1,24 +1,48 @@
+from itertools import chain, islice
+from collections import OrderedDict
+from functools import partial
+import json
 import pandas as pd
 
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
+    from . import spills
+    from . import aggregators as ag
+    from . import parallel
+    from . import pipelines
+    from . import writers
+    from . import columns_flux as cf
+    from . import joins
+    from . import bloom_filter as bf
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
+    import spills
+    import aggregators as ag
+    import parallel
+    import pipelines
+    import writers
+    import columns_flux as cf
+    import joins
+    import bloom_filter as bf
 
 
 def is_record(item):
     return isinstance(item, dict)
 
 
+def check_record(record, skip_errors=False):
+    if is_record(record):
+        return True
+    elif skip_errors:
+        return False
+    else:
+        raise TypeError('check_records(): this item is not record: {}'.format(record))
+
+
 def check_records(records, skip_errors=False):
     for r in records:
-        if is_record(r):
-            pass
-        elif skip_errors:
-            continue
-        else:
-            raise TypeError('check_records(): this item is not record: {}'.format(r))
-        yield r
+        if check_record(r, skip_errors):
+            yield r
 
 
 def topologically_sorted(selectors):
@@ -72,6 +96,58 @@ def select_fields(rec_in, *descriptions):
     return {f: record[f] for f in fields_out}
 
 
+def get_selector_function(*descriptions):
+    # compiles descriptions of select_fields() once into one function of record:
+    # output record is created without copy of input record, derived fields are read from output record
+    lines = ['def select(r):', '    o = dict()']
+    namespace = dict()
+    assigned_fields = set()
+    has_star, has_derived = False, False
+
+    def get_name(value):
+        name = 'v{}'.format(len(namespace))
+        namespace[name] = value
+        return name
+
+    def get_input(field):
+        if field in assigned_fields:
+            return 'o[{}]'.format(get_name(field))
+        else:
+            return '{}.get({})'.format('o' if has_star else 'r', get_name(field))
+    for desc in descriptions:
+        if desc == '*':
+            lines += ['    for k, v in r.items():', '        if k not in o:', '            o[k] = v']
+            has_star = True
+        elif isinstance(desc, (list, tuple)):
+            if len(desc) < 2:
+                raise ValueError('incorrect selector: {}'.format(desc))
+            f_out = desc[0]
+            fs_in = desc[1] if len(desc) == 2 else desc[1:]
+            if callable(fs_in):
+                expression = '{}({})'.format(get_name(fs_in), '{**r, **o}' if has_derived else 'r')
+            elif isinstance(fs_in, (list, tuple)):
+                function, fields = fx.process_selector_description(fs_in)
+                expression = '{}({})'.format(get_name(function), ', '.join([get_input(f) for f in fields]))
+            else:
+                expression = get_input(fs_in)
+            lines.append('    o[{}] = {}'.format(get_name(f_out), expression))
+            assigned_fields.add(f_out)
+            has_derived = True
+        elif desc not in assigned_fields:
+            if has_star:
+                lines.append('    o.setdefault({}, None)'.format(get_name(desc)))
+            else:
+                lines.append('    o[{name}] = r.get({name})'.format(name=get_name(desc)))
+            assigned_fields.add(desc)
+    lines.append('    return o')
+    exec('\n'.join(lines), namespace)
+    return namespace['select']
+
+
+def get_first(pair):
+    return pair[0]
+
+
 def get_key_function(descriptions, take_hash=False):
     if len(descriptions) == 0:
         raise ValueError('key must be defined')
@@ -88,7 +164,7 @@ def get_key_function(descriptions, take_hash=False):
 class RecordsFlux(fx.AnyFlux):
     def __init__(self, items, count=None, check=True):
         super().__init__(
-            items=check_records(items) if check else items,
+            items=pipelines.add_step(items, pipelines.StepType.check, check_record) if check else items,
             count=count,
         )
         self.check = check
@@ -140,10 +216,15 @@ class RecordsFlux(fx.AnyFlux):
             else:
                 descriptions.append([k] + [v])
         return self.native_map(
-            lambda r: select_fields(r, *descriptions),
+            get_selector_function(*descriptions),
         )
 
-    def filter(self, *fields):
+    def filter(
+            self,
+            *fields,
+            workers=None, executor=parallel.ExecutorType.thread,
+            chunk_size=parallel.DEFAULT_CHUNK_SIZE, ordered=True,
+    ):
         def filter_function(r):
             for f in fields:
                 if not select_value(r, f):
@@ -151,10 +232,14 @@ class RecordsFlux(fx.AnyFlux):
             return True
         props = self.meta()
         props.pop('count')
-        filtered_items = filter(filter_function, self.items)
-        if self.is_in_memory():
-            filtered_items = list(filtered_items)
-            props['count'] = len(filtered_items)
+        if workers:
+            functions = [partial(select_value, description=f) for f in fields]
+            filtered_items = parallel.filter_items(functions, self.items, workers, executor, chunk_size, ordered)
+            if self.is_in_memory():
+                filtered_items = list(filtered_items)
+                props['count'] = len(filtered_items)
+        else:  # for in-memory items count will be known after first access
+            filtered_items = pipelines.add_step(self.items, pipelines.StepType.filter, filter_function)
         return self.__class__(
             filtered_items,
             **props
@@ -166,12 +251,13 @@ class RecordsFlux(fx.AnyFlux):
             reverse=False,
             step=fx.MAX_ITEMS_IN_MEMORY, tmp_file_template='merge_sort_{}', encoding='utf8',
             verbose=True,
+            workers=None,
     ):
         key_function = get_key_function(keys)
         if self.is_in_memory() or (step is None) or (self.count is not None and self.count <= step):
             return self.memory_sort(key_function, reverse)
         else:
-            return self.disk_sort(key_function, reverse, step, tmp_file_template, encoding, verbose)
+            return self.disk_sort(key_function, reverse, step, tmp_file_template, encoding, verbose, workers=workers)
 
     def sorted_group_by(self, *keys, as_pairs=True):
         keys = fx.update_arg(keys)
@@ -200,8 +286,69 @@ class RecordsFlux(fx.AnyFlux):
             )
         return fx_groups.to_memory() if self.is_in_memory() else fx_groups
 
-    def group_by(self, *keys, step=None, as_pairs=True, verbose=True):
+    def hash_group_by(
+            self,
+            *keys,
+            step=None,
+            as_pairs=True,
+            partitions_count=spills.DEFAULT_PARTITIONS_COUNT,
+            spill_manager=None,
+            verbose=True,
+    ):
+        # groups in dict, spills records partitioned by key hash if count of records is over step
+        keys = fx.update_arg(keys)
+        key_function = get_key_function(keys)
+
+        def group_in_memory(records):
+            groups = dict()
+            for r in records:
+                k = key_function(r)
+                if k in groups:
+                    groups[k].append(r)
+                else:
+                    groups[k] = [r]
+            for k, group in groups.items():
+                yield (k, group) if as_pairs else group
+
+        def get_groups():
+            iterator = iter(self.items)
+            head = list(islice(iterator, step)) if step else list(iterator)
+            tail = list(islice(iterator, 1))
+            if not tail:
+                yield from group_in_memory(head)
+            else:
+                manager = self.get_spill_manager('group_by_{}.tmp', spill_manager=spill_manager)
+                try:
+                    records = chain(head, tail, iterator)
+                    partitions = manager.dump_partitions(records, key_function, partitions_count, step)
+                    head.clear()
+                    if verbose:
+                        print('Records are spilled into {} partitions in {}'.format(partitions_count, manager.path))
+                    for filenames in partitions:
+                        yield from group_in_memory(manager.load_partition(filenames))
+                finally:
+                    manager.close()
+        if as_pairs:
+            fx_groups = fx.PairsFlux(
+                get_groups(),
+                secondary=fx.FluxType.RowsFlux,
+            )
+        else:
+            fx_groups = fx.RowsFlux(
+                get_groups(),
+                check=False,
+            )
+        return fx_groups.to_memory() if self.is_in_memory() else fx_groups
+
+    def group_by(self, *keys, step=None, as_pairs=True, verbose=True, workers=None, use_hash=False):
         keys = fx.update_arg(keys)
+        if use_hash:
+            return self.hash_group_by(
+                keys,
+                step=step,
+                as_pairs=as_pairs,
+                verbose=verbose,
+            )
         if not as_pairs:
             keys = [
                 get_key_function(keys, take_hash=True),
@@ -210,6 +357,7 @@ class RecordsFlux(fx.AnyFlux):
             *keys,
             step=step,
             verbose=verbose,
+            workers=workers,
         )
         grouped_fx = sorted_fx.sorted_group_by(
             keys,
@@ -217,12 +365,165 @@ class RecordsFlux(fx.AnyFlux):
         )
         return grouped_fx
 
+    def aggregate(
+            self,
+            *keys,
+            use_hash=True,
+            step=None,
+            partitions_count=spills.DEFAULT_PARTITIONS_COUNT,
+            spill_manager=None,
+            verbose=True,
+            **aggregators
+    ):
+        # aggregators are like sum='field' or mean=('field_a', 'field_b') or count='*',
+        # only accumulators are kept in memory, not the records of group
+        keys = fx.update_arg(keys)
+        descriptions = ag.get_descriptions(aggregators)
+        key_function = get_key_function(keys) if keys else (lambda r: None)
+
+        def get_record(key, accumulators):
+            record = dict()
+            key_values = key if len(keys) > 1 else [key]
+            for n, (k, v) in enumerate(zip(keys, key_values)):
+                record[k if isinstance(k, str) else 'key_{}'.format(n)] = v
+            record.update(ag.get_results(accumulators, descriptions))
+            return record
+
+        def get_sorted_aggregates(records):
+            accumulators, prev_k = None, None
+            for r in records:
+                k = key_function(r)
+                if accumulators is None or k != prev_k:
+                    if accumulators is not None:
+                        yield get_record(prev_k, accumulators)
+                    accumulators, prev_k = ag.get_accumulators(descriptions), k
+                ag.add_record(accumulators, descriptions, r)
+            if accumulators is not None:
+                yield get_record(prev_k, accumulators)
+
+        def get_hash_aggregates():
+            groups, partitions = dict(), [list() for _ in range(partitions_count)]
+            manager = self.get_spill_manager('aggregate_{}.tmp', spill_manager=spill_manager)
+            try:
+                for r in self.items:
+                    k = key_function(r)
+                    accumulators = groups.get(k)
+                    if accumulators is None:
+                        if step and len(groups) >= step:  # partial aggregates are spilled and merged later
+                            spilled = manager.dump_partitions(groups.items(), get_first, partitions_count)
+                            partitions = [a + b for a, b in zip(partitions, spilled)]
+                            groups = dict()
+                        accumulators = groups[k] = ag.get_accumulators(descriptions)
+                    ag.add_record(accumulators, descriptions, r)
+                if not any(partitions):
+                    for k, accumulators in groups.items():
+                        yield get_record(k, accumulators)
+                    return
+                spilled = manager.dump_partitions(groups.items(), get_first, partitions_count)
+                partitions = [a + b for a, b in zip(partitions, spilled)]
+                groups = dict()
+                if verbose:
+                    print('Partial aggregates are spilled into {} partitions'.format(partitions_count))
+                for filenames in partitions:
+                    merged = dict()
+                    for k, accumulators in manager.load_partition(filenames):
+                        if k in merged:
+                            ag.merge_accumulators(merged[k], accumulators)
+                        else:
+                            merged[k] = accumulators
+                    for k, accumulators in merged.items():
+                        yield get_record(k, accumulators)
+            finally:
+                manager.close()
+        if use_hash:
+            aggregated = get_hash_aggregates()
+        else:
+            sorted_items = self.sort(*keys, step=step, verbose=verbose).items if keys else self.items
+            aggregated = get_sorted_aggregates(sorted_items)
+        return RecordsFlux(
+            list(aggregated) if self.is_in_memory() else aggregated,
+            check=False,
+        )
+
+    def sorted_join(self, right, *keys, how='left', right_keys=None, reverse=False):
+        # merge join of records sorted by keys (i.e. by sort()) in one pass over both sides,
+        # only right records with current key are kept in memory, fields of right record overwrite left ones
+        keys = fx.update_arg(keys)
+        right_items = right.items if isinstance(right, fx.AnyFlux) else right
+        joined = joins.merge_join(
+            self.items, right_items,
+            get_key_function(keys), get_key_function(right_keys or keys),
+            how=how, reverse=reverse,
+        )
+        return RecordsFlux(
+            map(lambda p: joins.merge_values(*p), joined),
+            check=False,
+        )
+
+    def get_bloom_filter(self, *keys, capacity=None, error_rate=bf.DEFAULT_ERROR_RATE):
+        keys = fx.update_arg(keys)
+        key_function = get_key_function(keys)
+        capacity = bf.get_capacity(capacity, self.expected_count())
+        return bf.from_keys(map(key_function, self.items), capacity, error_rate)
+
+    def semi_join(self, right, *keys, right_keys=None, capacity=None, error_rate=bf.DEFAULT_ERROR_RATE):
+        # keeps records with keys found in bloom filter of right keys (or in right BloomFilter or set),
+        # a few records without match can pass (false positives), so it is a pre-filter before exact join
+        keys = fx.update_arg(keys)
+        if isinstance(right, RecordsFlux):
+            right = right.get_bloom_filter(*(right_keys or keys), capacity=capacity, error_rate=error_rate)
+        key_function = get_key_function(keys)
+        props = self.meta()
+        props.pop('count')
+        return self.__class__(
+            pipelines.add_step(self.items, pipelines.StepType.filter, lambda r: key_function(r) in right),
+            **props
+        )
+
+    def stratified_sample(self, key, n_per_stratum, seed=None):
+        # key is field, description or list of them
+        key_function = get_key_function(fx.update_arg([key]))
+        return super().stratified_sample(key_function, n_per_stratum, seed)
+
     def get_dataframe(self, columns=None):
         dataframe = pd.DataFrame(self.items)
         if columns:
             dataframe = dataframe[columns]
         return dataframe
 
+    def to_columns(self, batch_size=cf.DEFAULT_BATCH_SIZE, columns=None):
+        # records are collected into batches of numpy arrays by columns
+        def get_batches():
+            batch = list()
+            for r in self.items:
+                batch.append(r)
+                if len(batch) >= batch_size:
+                    yield cf.get_batch(batch, columns)
+                    batch = list()
+            if batch:
+                yield cf.get_batch(batch, columns)
+        return fx.ColumnsFlux(
+            get_batches(),
+            check=False,
+        )
+
+    def to_partitioned_files(
+            self, template, *keys,
+            partitions_count=None,
+            max_open_files=writers.DEFAULT_MAX_OPEN_FILES, encoding=None,
+    ):
+        # records are written as json lines into files by key fields, i.e. 'shop_{}.json', 'shop_id'
+        keys = fx.update_arg(keys)
+        partitions = super().to_partitioned_files(
+            template, get_key_function(keys),
+            partitions_count, json.dumps,
+            max_open_files, encoding,
+        )
+        if partitions_count:
+            return [f.parse_json() for f in partitions]
+        else:
+            return OrderedDict([(k, f.parse_json()) for k, f in partitions.items()])
+
     def to_lines(self, columns, add_title_row=False, delimiter='\t'):
         return fx.LinesFlux(
             self.to_rows(columns, add_title_row=add_title_row),
@@ -0,0 +1,81 @@
+from collections import deque
+from enum import Enum
+
+
+DEFAULT_MAX_BUFFERED = 100000  # items waiting in queues of outputs in queue mode
+DEFAULT_SPILL_STEP = 100000  # items of one output in memory before spilling in disk mode
+
+
+class RouteMode(Enum):
+    memory = 'memory'  # unread items of each output are kept in memory
+    queue = 'queue'  # count of unread items is limited, BufferError is raised if outputs are consumed unevenly
+    disk = 'disk'  # source is routed at once, items of each output are spilled into files by step
+
+
+class Router:
+    # reads source once, calculates key of each item once and puts item into buffer of output with this number,
+    # items with keys out of range(count) are dropped
+    def __init__(
+            self,
+            items, key_function, count,
+            mode=RouteMode.memory,
+            max_buffered=DEFAULT_MAX_BUFFERED,
+            step=DEFAULT_SPILL_STEP,
+            spill_manager=None,
+    ):
+        self.iterator = iter(items)
+        self.key_function = key_function
+        self.count = count
+        self.mode = RouteMode(mode)
+        self.max_buffered = max_buffered
+        self.step = step
+        self.spill_manager = spill_manager
+        assert self.mode != RouteMode.disk or spill_manager is not None, 'spill_manager is required for disk mode'
+        self.buffers = {n: deque() for n in range(count)}
+        self.spilled = {n: list() for n in range(count)}
+        self.buffered_count = 0
+        self.finished = False
+
+    def pull(self):
+        # routes next item from source, returns False if source is finished
+        for i in self.iterator:
+            buffer = self.buffers.get(self.key_function(i))
+            if buffer is not None:
+                buffer.append(i)
+                self.buffered_count += 1
+                if self.mode == RouteMode.queue and self.buffered_count > self.max_buffered:
+                    raise BufferError(
+                        'Router: more than {} unread items, consume outputs evenly or use disk mode'.format(
+                            self.max_buffered,
+                        )
+                    )
+            return True
+        self.finished = True
+        return False
+
+    def route_all(self):
+        # spills buffers of outputs into files after each step items
+        while self.pull():
+            for n, buffer in self.buffers.items():
+                if len(buffer) >= self.step:
+                    filename, _ = self.spill_manager.dump(buffer)
+                    self.spilled[n].append(filename)
+                    self.buffered_count -= len(buffer)
+                    buffer.clear()
+
+    def get_output(self, n):
+        buffer = self.buffers[n]
+        if self.mode == RouteMode.disk:
+            if not self.finished:
+                self.route_all()
+            filenames, self.spilled[n] = self.spilled[n], list()
+            yield from self.spill_manager.load_partition(filenames)
+        while buffer or not self.finished:
+            if buffer:
+                self.buffered_count -= 1
+                yield buffer.popleft()
+            else:
+                self.pull()
+
+    def get_outputs(self):
+        return [self.get_output(n) for n in range(self.count)]
@@ -1,22 +1,28 @@
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
+    from . import pipelines
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
+    import pipelines
 
 
 def is_row(row):
     return isinstance(row, (list, tuple))
 
 
+def check_row(row, skip_errors=False):
+    if is_row(row):
+        return True
+    elif skip_errors:
+        return False
+    else:
+        raise TypeError('check_records(): this item is not row: {}'.format(row))
+
+
 def check_rows(rows, skip_errors=False):
     for i in rows:
-        if is_row(i):
-            pass
-        elif skip_errors:
-            continue
-        else:
-            raise TypeError('check_records(): this item is not row: {}'.format(i))
-        yield i
+        if check_row(i, skip_errors):
+            yield i
 
 
 def select_value(row, description):
@@ -47,10 +53,35 @@ def select_columns(row_in, *columns):
     return tuple(row_out)
 
 
+def get_selector_function(*columns):
+    # compiles descriptions of select_columns() once into one function of row returning tuple
+    namespace = dict()
+    expressions = list()
+    for d in columns:
+        if d == '*':
+            expressions.append('*r')
+        elif callable(d):
+            namespace['f{}'.format(len(namespace))] = d
+            expressions.append('f{}(r)'.format(len(namespace) - 1))
+        elif isinstance(d, (list, tuple)):
+            function, inputs = fx.process_selector_description(d)
+            namespace['f{}'.format(len(namespace))] = function
+            arguments = ', '.join(['r[{!r}]'.format(c) for c in inputs])
+            expressions.append('f{}({})'.format(len(namespace) - 1, arguments))
+        elif isinstance(d, int):
+            expressions.append('r[{}]'.format(d))
+        else:
+            raise TypeError('selector description must be int, callable or tuple ({} as {} given)'.format(
+                d, type(d)
+            ))
+    exec('def select(r):\n    return ({}{})'.format(', '.join(expressions), ',' if expressions else ''), namespace)
+    return namespace['select']
+
+
 class RowsFlux(fx.AnyFlux):
     def __init__(self, items, count=None, check=True):
         super().__init__(
-            items=check_rows(items) if check else items,
+            items=pipelines.add_step(items, pipelines.StepType.check, check_row) if check else items,
             count=count,
         )
         self.check = check
@@ -71,7 +102,7 @@ class RowsFlux(fx.AnyFlux):
 
     def select(self, *columns):
         return self.native_map(
-            lambda r: select_columns(r, *columns),
+            get_selector_function(*columns),
         )
 
     def to_records(self, function=None, columns=[]):
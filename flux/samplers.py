@@ -0,0 +1,106 @@
+from itertools import islice, repeat
+from math import exp, floor, log
+from random import Random
+
+
+MAX_FRACTION_BY_POSITIONS = 0.25  # for denser samples one pass over items is faster than seeks to positions
+
+
+def get_open_random(generator):
+    # random value in (0, 1), so logarithm of it is finite and negative
+    value = generator.random()
+    while value == 0.0:
+        value = generator.random()
+    return value
+
+
+def get_gaps(fraction, generator):
+    # counts of items skipped before each sampled item: geometric distribution of gaps between items
+    # taken with probability fraction, so skipped items are passed by islice() without calls of random()
+    if fraction >= 1:
+        yield from repeat(0)
+    log_q = log(1 - fraction)
+    while True:
+        yield floor(log(get_open_random(generator)) / log_q)
+
+
+def reservoir_sample(items, n, seed=None):
+    # uniform sample of n items in one pass with n items in memory (Algorithm L: random count of items is skipped
+    # before each replacement in reservoir), sampled items are returned in order of source
+    generator = Random(seed)
+    indexed_items = enumerate(items)
+    reservoir = list(islice(indexed_items, max(n, 0)))
+    if len(reservoir) == n and n > 0:
+        weight = exp(log(get_open_random(generator)) / n)
+        while True:
+            skip = floor(log(get_open_random(generator)) / log(1 - weight))
+            indexed_item = next(islice(indexed_items, skip, None), None)
+            if indexed_item is None:
+                break
+            reservoir[generator.randrange(n)] = indexed_item
+            weight *= exp(log(get_open_random(generator)) / n)
+    reservoir.sort(key=lambda p: p[0])
+    return [i for _, i in reservoir]
+
+
+def bernoulli_sample(items, fraction, seed=None):
+    # lazy sample: each item is taken with probability fraction
+    if fraction <= 0:
+        return
+    iterator = iter(items)
+    missing = object()
+    for skip in get_gaps(fraction, Random(seed)):
+        item = next(islice(iterator, skip, None), missing)
+        if item is missing:
+            break
+        yield item
+
+
+def stratified_sample(items, key_function, n, seed=None):
+    # uniform sample of n items for each value of key in one pass (reservoir of n items for each stratum),
+    # sampled items are returned in order of source
+    generator = Random(seed)
+    reservoirs, counts = dict(), dict()
+    for position, i in enumerate(items):
+        key = key_function(i)
+        reservoir = reservoirs.get(key)
+        if reservoir is None:
+            reservoir = reservoirs[key] = list()
+            counts[key] = 0
+        counts[key] += 1
+        if len(reservoir) < n:
+            reservoir.append((position, i))
+        else:
+            replaced = generator.randrange(counts[key])
+            if replaced < n:
+                reservoir[replaced] = (position, i)
+    sampled = sorted([p for r in reservoirs.values() for p in r], key=lambda p: p[0])
+    return [i for _, i in sampled]
+
+
+def get_sample_positions(count, n, seed=None):
+    # sorted positions of n items uniformly sampled from count items
+    if n >= count:
+        return list(range(count))
+    return sorted(Random(seed).sample(range(count), max(n, 0)))
+
+
+def get_fraction_positions(count, fraction, seed=None):
+    if fraction <= 0:
+        return
+    position = -1
+    for skip in get_gaps(fraction, Random(seed)):
+        position += skip + 1
+        if position >= count:
+            break
+        yield position
+
+
+def get_items_by_positions(source, positions):
+    # source supports random access (list or line_index.IndexedLines), positions are sorted for sequential reading,
+    # indexed lines are read through one open mmap of file
+    if hasattr(source, 'read_positions'):
+        yield from source.read_positions(positions)
+    else:
+        for p in positions:
+            yield source[p]
@@ -1,3 +1,6 @@
+from itertools import islice
+import csv
+
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
@@ -6,6 +9,7 @@ except ImportError:  # Apparently no higher-level package has been imported, fal
 
 NAME_POS, TYPE_POS, HINT_POS = 0, 1, 2
 TYPE_CONV_FUNCS = dict(bool=bool, int=int, float=float, str=str, text=str, date=str)
+DEFAULT_BLOCK_SIZE = 10000  # lines parsed and casted at once in parse_csv_blocks()
 
 
 def is_row(row):
@@ -38,7 +42,7 @@ def check_rows(rows, schema, skip_errors=False):
 
 
 def get_cast_function(field_type):
-    return TYPE_CONV_FUNCS[field_type]
+    return field_type if isinstance(field_type, type) else TYPE_CONV_FUNCS[field_type]
 
 
 def cast(value, field_type, default_int=0):
@@ -70,6 +74,68 @@ def apply_schema_to_row(row, schema, skip_bad_values=False, verbose=True):
     return row
 
 
+def cast_column(values, field_type, bad_rows):
+    # whole column is casted by one map() call, values are casted one by one only if column has bad value,
+    # numbers of bad values are added into bad_rows dict with error messages
+    cast_function = get_cast_function(field_type)
+    if cast_function == str:
+        return list(values)
+    try:
+        return list(map(cast_function, values))
+    except ValueError:
+        casted = list()
+        for n, value in enumerate(values):
+            try:
+                casted.append(cast(value, field_type))
+            except ValueError as e:
+                casted.append(None)
+                bad_rows.setdefault(n, str(e))
+        return casted
+
+
+def parse_csv_block(lines, schema, delimiter=None):
+    # returns rows with values casted by columns and dict of bad rows: {number of row in block: (row, message)}
+    rows = list(csv.reader(lines, delimiter=delimiter) if delimiter else csv.reader(lines))
+    width = len(schema)
+    bad_rows = {
+        n: (r, 'expected {} values, got {}'.format(width, len(r)))
+        for n, r in enumerate(rows) if len(r) != width
+    }
+    if bad_rows:
+        positions = [n for n in range(len(rows)) if n not in bad_rows]
+        rows = [rows[n] for n in positions]
+    else:
+        positions = range(len(rows))
+    if not rows:
+        return list(), bad_rows
+    bad_values = dict()
+    columns = [cast_column(c, d[TYPE_POS], bad_values) for c, d in zip(zip(*rows), schema)]
+    casted_rows = list(map(list, zip(*columns)))
+    if bad_values:
+        for n, message in bad_values.items():
+            bad_rows[positions[n]] = (rows[n], message)
+        casted_rows = [r for n, r in enumerate(casted_rows) if n not in bad_values]
+    return casted_rows, bad_rows
+
+
+def parse_csv_blocks(lines, schema, delimiter=None, block_size=DEFAULT_BLOCK_SIZE, bad_rows=None):
+    # one row per line is expected, bad rows are appended into bad_rows list as (number of line, row, message),
+    # ValueError is raised for first bad row if bad_rows list is not given
+    iterator = iter(lines)
+    first_n = 0
+    block = list(islice(iterator, block_size))
+    while block:
+        rows, bad_in_block = parse_csv_block(block, schema, delimiter)
+        for n in sorted(bad_in_block):
+            row, message = bad_in_block[n]
+            if bad_rows is None:
+                raise ValueError('Bad row {}: {} ({})'.format(first_n + n, row, message))
+            bad_rows.append((first_n + n, row, message))
+        yield from rows
+        first_n += len(block)
+        block = list(islice(iterator, block_size))
+
+
 class SchemaFlux(fx.RowsFlux):
     def __init__(self, items, count=None, check=True, schema=None):
         super().__init__(
@@ -81,9 +147,9 @@ class SchemaFlux(fx.RowsFlux):
 
     def meta(self):
         return dict(
-            count=self.count(),
-            check=self.check(),
-            schema=self.schema(),
+            count=self.count,
+            check=self.check,
+            schema=self.schema,
         )
 
     def is_valid_item(self, item):
@@ -99,6 +165,15 @@ class SchemaFlux(fx.RowsFlux):
             skip_errors,
         )
 
+    @staticmethod
+    def from_csv_lines(lines, schema, delimiter=None, block_size=None, bad_rows=None, count=None):
+        return SchemaFlux(
+            parse_csv_blocks(lines, schema, delimiter, block_size or DEFAULT_BLOCK_SIZE, bad_rows),
+            count=None if bad_rows is not None else count,
+            check=False,
+            schema=schema,
+        )
+
     def set_schema(self, schema, check=True):
         return SchemaFlux(
             items=check_rows(self.items, schema=schema) if check else self.items,
@@ -0,0 +1,242 @@
+from operator import itemgetter
+from enum import Enum
+import tempfile
+import weakref
+import marshal
+import pickle
+import shutil
+import struct
+import errno
+import json
+import zlib
+import os
+
+
+DEFAULT_FRAME_SIZE = 10000  # items per frame
+FRAME_HEADER = struct.Struct('<Q')  # length of frame in bytes
+COMPRESS_LEVEL = 1
+TMP_DIR = None  # parent for temporary directories of spill managers, system default is used if None
+TMP_DIR_PREFIX = 'flux_'
+DEFAULT_FILE_TEMPLATE = 'spill_{}.tmp'
+DEFAULT_PARTITIONS_COUNT = 16
+MAX_SPILL_BYTES = None  # limit of disk usage by one spill manager, unlimited if None
+
+
+class SpillFormat(Enum):
+    json = 'json'
+    pickle = 'pickle'
+    marshal = 'marshal'
+
+
+DEFAULT_SPILL_FORMAT = SpillFormat.pickle
+
+
+def get_serializers(spill_format=DEFAULT_SPILL_FORMAT, encoding='utf8'):
+    spill_format = SpillFormat(spill_format)
+    if spill_format == SpillFormat.json:
+        return (
+            lambda frame: json.dumps(frame).encode(encoding),
+            lambda data: json.loads(data.decode(encoding)),
+        )
+    elif spill_format == SpillFormat.pickle:
+        return (
+            lambda frame: pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL),
+            pickle.loads,
+        )
+    elif spill_format == SpillFormat.marshal:
+        return marshal.dumps, marshal.loads
+
+
+def get_frames(items, frame_size=DEFAULT_FRAME_SIZE):
+    frame = list()
+    for i in items:
+        frame.append(i)
+        if len(frame) >= frame_size:
+            yield frame
+            frame = list()
+    if frame:
+        yield frame
+
+
+def dump_items(
+        items, filename,
+        spill_format=DEFAULT_SPILL_FORMAT, compress=False,
+        frame_size=DEFAULT_FRAME_SIZE, encoding='utf8',
+        max_bytes=None,
+):
+    # writes items as length-prefixed frames, returns count of written items
+    dumps, _ = get_serializers(spill_format, encoding)
+    count, size = 0, 0
+    with open(filename, 'wb') as fh:
+        for frame in get_frames(items, frame_size):
+            data = dumps(frame)
+            if compress:
+                data = zlib.compress(data, COMPRESS_LEVEL)
+            size += FRAME_HEADER.size + len(data)
+            if max_bytes is not None and size > max_bytes:
+                message = 'spill size limit exceeded ({} bytes) while writing'.format(max_bytes)
+                raise OSError(errno.EDQUOT, message, filename)
+            fh.write(FRAME_HEADER.pack(len(data)))
+            fh.write(data)
+            count += len(frame)
+    return count
+
+
+def load_items(filename, spill_format=DEFAULT_SPILL_FORMAT, compress=False, encoding='utf8'):
+    _, loads = get_serializers(spill_format, encoding)
+    with open(filename, 'rb') as fh:
+        while True:
+            header = fh.read(FRAME_HEADER.size)
+            if not header:
+                break
+            size, = FRAME_HEADER.unpack(header)
+            data = fh.read(size)
+            if compress:
+                data = zlib.decompress(data)
+            yield from loads(data)
+
+
+def dump_sorted_items(
+        keyed_items, filename, reverse=False,
+        spill_format=DEFAULT_SPILL_FORMAT, compress=False, encoding='utf8',
+        max_bytes=None,
+):
+    # keyed_items is list of (key, item) pairs, it can be sorted and dumped in another process
+    keyed_items.sort(key=itemgetter(0), reverse=reverse)
+    return dump_items(
+        map(itemgetter(1), keyed_items), filename,
+        spill_format, compress,
+        encoding=encoding,
+        max_bytes=max_bytes,
+    )
+
+
+class SpillManager:
+    def __init__(
+            self,
+            template=DEFAULT_FILE_TEMPLATE, directory=None, max_bytes=None,
+            spill_format=DEFAULT_SPILL_FORMAT, compress=False, encoding='utf8',
+    ):
+        self.template = template if '{}' in template else template + '_{}'
+        self.directory = directory or TMP_DIR
+        self.max_bytes = max_bytes or MAX_SPILL_BYTES
+        self.spill_format = SpillFormat(spill_format)
+        self.compress = compress
+        self.encoding = encoding
+        self.path = None
+        self.finalizer = None
+        self.files_count = 0
+        self.file_sizes = dict()
+        self.file_readers = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_path(self):
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix=TMP_DIR_PREFIX, dir=self.directory)
+            self.finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        return self.path
+
+    def get_used_bytes(self):
+        return sum(self.file_sizes.values())
+
+    def get_available_bytes(self):
+        if self.max_bytes is not None:
+            return self.max_bytes - self.get_used_bytes()
+
+    def get_filename(self, name=None):
+        name = self.template.format(name if name is not None else self.files_count)
+        self.files_count += 1
+        filename = os.path.join(self.get_path(), name)
+        assert filename not in self.file_sizes, 'file {} already exists'.format(filename)
+        return filename
+
+    def register(self, filename, readers=1):
+        self.file_sizes[filename] = os.path.getsize(filename)
+        self.file_readers[filename] = readers
+        available_bytes = self.get_available_bytes()
+        if available_bytes is not None and available_bytes < 0:
+            self.remove(filename)
+            raise OSError(errno.EDQUOT, 'spill size limit exceeded ({} bytes)'.format(self.max_bytes), filename)
+
+    def dump(self, items, name=None, readers=1):
+        # file will be removed after it has been read by given count of readers, returns (filename, count)
+        filename = self.get_filename(name)
+        try:
+            count = dump_items(
+                items, filename,
+                self.spill_format, self.compress,
+                encoding=self.encoding,
+                max_bytes=self.get_available_bytes(),
+            )
+        except BaseException:
+            if os.path.exists(filename):
+                os.remove(filename)
+            raise
+        self.register(filename, readers)
+        return filename, count
+
+    def submit_sorted(self, executor, keyed_items, reverse=False, name=None):
+        # sorts and dumps items in executor, file must be registered when future is done, returns (filename, future)
+        filename = self.get_filename(name)
+        future = executor.submit(
+            dump_sorted_items,
+            keyed_items, filename, reverse,
+            self.spill_format, self.compress, self.encoding,
+            self.get_available_bytes(),
+        )
+        return filename, future
+
+    def dump_partitions(self, items, key_function, partitions_count=DEFAULT_PARTITIONS_COUNT, step=None):
+        # distributes items into files by hash of key, keeps in memory not more than step items,
+        # returns list of lists of filenames for each partition
+        partitions = [list() for _ in range(partitions_count)]
+        buckets = [list() for _ in range(partitions_count)]
+
+        def flush_buckets():
+            for n, b in enumerate(buckets):
+                if b:
+                    filename, _ = self.dump(b)
+                    partitions[n].append(filename)
+                    buckets[n] = list()
+        buffered_count = 0
+        for i in items:
+            buckets[hash(key_function(i)) % partitions_count].append(i)
+            buffered_count += 1
+            if step and buffered_count >= step:
+                flush_buckets()
+                buffered_count = 0
+        flush_buckets()
+        return partitions
+
+    def load_partition(self, filenames):
+        for filename in filenames:
+            yield from self.load(filename)
+
+    def load(self, filename):
+        try:
+            yield from load_items(filename, self.spill_format, self.compress, self.encoding)
+        finally:
+            self.file_readers[filename] = self.file_readers.get(filename, 1) - 1
+            if self.file_readers[filename] <= 0:
+                self.remove(filename)
+
+    def remove(self, filename):
+        self.file_sizes.pop(filename, None)
+        self.file_readers.pop(filename, None)
+        if os.path.exists(filename):
+            os.remove(filename)
+        if not self.file_sizes:
+            self.close()
+
+    def close(self):
+        if self.finalizer is not None:
+            self.finalizer()
+        self.path = None
+        self.finalizer = None
+        self.file_sizes = dict()
+        self.file_readers = dict()
@@ -1,11 +1,25 @@
+from decimal import Decimal
+import gzip
+import os
+
 try:  # Assume we're a sub-module in a package.
     from . import fluxes as fx
+    from . import any_flux as af
     from . import mappers_and_reducers as mr
     from . import readers
+    from . import spills
+    from . import records_flux as rf
+    from . import rows_flux as rw
+    from . import bloom_filter as bf
 except ImportError:  # Apparently no higher-level package has been imported, fall back to a local import.
     import fluxes as fx
+    import any_flux as af
     import mappers_and_reducers as mr
     import readers
+    import spills
+    import records_flux as rf
+    import rows_flux as rw
+    import bloom_filter as bf
 
 
 EXAMPLE_FILENAME = 'test_file.tmp'
@@ -93,6 +107,113 @@ def test_filter():
     assert received == expected
 
 
+def test_parallel_map_and_filter():
+    expected_0 = [-i for i in EXAMPLE_INT_SEQUENCE]
+    received_0 = readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).map(
+        abs,
+    ).map(
+        lambda i: -i,
+        workers=2,
+        executor='thread',
+        chunk_size=2,
+    ).get_list()
+    assert received_0 == expected_0, 'test case 0: ordered map'
+    expected_1 = sorted(str(i) for i in EXAMPLE_INT_SEQUENCE)
+    received_1 = readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).map(
+        str,
+        to=fx.FluxType.LinesFlux,
+        workers=2,
+        executor='process',
+        chunk_size=2,
+        ordered=False,
+    ).get_list()
+    assert sorted(received_1) == expected_1, 'test case 1: unordered map by processes'
+    received = fx.AnyFlux([1, 2, 3]).map(lambda i: i + 1, workers=2).filter(lambda i: i > 2, workers=2).get_list()
+    assert received == [3, 4], 'lambdas with default executor'
+    received = fx.RecordsFlux([dict(x=1), dict(x=2)]).filter(lambda r: r['x'] > 1, workers=2).get_list()
+    assert received == [dict(x=2)], 'records filter by lambda with default executor'
+    expected_2 = [{'x': 7}, {'x': 9}, {'x': 6}, {'x': 8}]
+    received_2 = readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).map_to_records(
+        lambda i: dict(x=i, y=i > 5),
+    ).filter(
+        'y',
+        workers=2,
+        chunk_size=4,
+    ).select(
+        'x',
+    ).get_list()
+    assert received_2 == expected_2, 'test case 2: filter records'
+
+
+def test_lazy_in_memory_steps():
+    calls = list()
+    expected = [-7, -9, -6, -8]
+    flux = fx.AnyFlux(
+        EXAMPLE_INT_SEQUENCE,
+        count=len(EXAMPLE_INT_SEQUENCE),
+    ).map(
+        lambda i: calls.append(i) or i,
+    ).filter(
+        lambda i: i > 5,
+    ).map(
+        lambda i: -i,
+    )
+    assert flux.is_in_memory(), 'in memory'
+    assert not calls, 'steps are not applied before terminal call'
+    assert flux.count is None, 'count is unknown before terminal call'
+    received = flux.get_list()
+    assert received == expected, 'items'
+    assert flux.count == len(expected), 'count is known after terminal call'
+    assert calls == EXAMPLE_INT_SEQUENCE, 'steps are applied once'
+    assert flux.get_list() == expected, 'items are reusable'
+    streaming = fx.AnyFlux(iter(EXAMPLE_INT_SEQUENCE)).map(lambda i: -i)
+    assert streaming.final_count() == len(EXAMPLE_INT_SEQUENCE), 'streaming items are counted by iterating'
+    assert not streaming.items.is_materialized(), 'streaming items are not collected into list'
+    filtered = fx.AnyFlux([1, 2, 3, 4]).filter(lambda i: i > 1)
+    assert filtered.expected_count() == 3, 'count of in-memory items is resolved lazily'
+    added = fx.AnyFlux([1, 2], count=2).add_flux(fx.AnyFlux([1, 2, 3, 4]).filter(lambda i: i > 1))
+    assert added.count == 5 and added.get_list() == [1, 2, 2, 3, 4], 'add_flux() of filtered flux'
+    added = fx.AnyFlux([1, 2], count=2).add_flux(fx.AnyFlux(iter([3, 4])))
+    assert added.count is None and added.get_list() == [1, 2, 3, 4], 'count is unknown if one of counts is unknown'
+
+
+def test_pipeline_plan():
+    pulled = list()
+    expected = [{'x': 30}, {'x': 50}]
+
+    def get_items():
+        for i in EXAMPLE_INT_SEQUENCE:
+            pulled.append(i)
+            yield i
+    flux = fx.AnyFlux(
+        get_items(),
+    ).map_to_records(
+        lambda i: dict(x=i * 10),
+    ).take(
+        3,
+    ).skip(
+        1,
+    )
+    plan = flux.explain(show=False)
+    assert plan[-2].strip() == 'slice of source: take(3) -> skip(1)', 'take and skip are pushed upstream to source'
+    assert plan[-1].strip() == 'one loop: map(get_record) -> check(check_record)', 'steps are fused'
+    assert fx.RecordsFlux(flux.items, check=True).explain(show=False) == plan, 'redundant check is removed'
+    received = flux.get_list()
+    assert received == expected, 'items'
+    assert pulled == EXAMPLE_INT_SEQUENCE[:3], 'items after limit are not pulled from source'
+    flux = fx.AnyFlux(iter(range(100))).take(3)
+    assert flux.one() == 0 and flux.get_list() == [1, 2], 'partly read streaming items are not repeated'
+    flux = fx.AnyFlux(iter(range(100))).take(3)
+    assert next(flux.items) == 0, 'streaming pipeline is iterator'
+    assert flux.map(lambda i: -i).get_list() == [-1, -2], 'next steps continue started loop'
+
+
 def test_take():
     expected = [1, 3, 5, 7, 9]
     received = readers.from_list(
@@ -191,6 +312,15 @@ def test_save_and_read():
     ).get_list()
     assert received_0 == expected, 'test case 0'
     assert received_1 == expected, 'test case 1'
+    received = readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).to_lines(
+    ).lazy_save(
+        EXAMPLE_FILENAME,
+        verbose=False,
+    ).take(3).get_list()
+    assert received == expected[:3]
+    assert readers.from_file(EXAMPLE_FILENAME).get_list() == expected[:3], 'consumed lines are saved after early stop'
     readers.from_list(
         EXAMPLE_INT_SEQUENCE,
     ).to_lines(
@@ -203,6 +333,261 @@ def test_save_and_read():
     assert received_2 == expected, 'test case 2'
 
 
+def test_read_without_count():
+    expected = [str(i) for i in EXAMPLE_INT_SEQUENCE]
+    readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).to_lines(
+    ).to_file(
+        EXAMPLE_FILENAME,
+        verbose=False,
+        return_flux=False,
+    )
+    flux = readers.from_file(EXAMPLE_FILENAME, lazy_count=True)
+    assert flux.count is None, 'count is unknown before reading'
+    assert flux.get_list() == expected, 'plain file'
+    gz_filename = EXAMPLE_FILENAME + '.gz'
+    with gzip.open(gz_filename, 'wt') as fh:
+        fh.write('\n'.join(expected))
+    flux = readers.from_file(gz_filename)
+    assert flux.count is None, 'lazy count is default for gz'
+    assert flux.get_list() == expected, 'gz file'
+    assert readers.estimate_lines_count(gz_filename, gz=True) == len(expected), 'small file is counted exactly'
+    assert readers.from_file(gz_filename, lazy_count=False).get_list() == expected, 'gz file with count'
+    os.remove(gz_filename)
+
+
+def test_read_in_parallel():
+    expected = [dict(n=n, x=i) for n, i in enumerate(EXAMPLE_INT_SEQUENCE)]
+    readers.from_list(
+        expected,
+    ).to_json(
+    ).to_file(
+        EXAMPLE_FILENAME,
+        verbose=False,
+        return_flux=False,
+    )
+    byte_ranges = readers.get_byte_ranges(EXAMPLE_FILENAME, chunk_bytes=30)
+    assert len(byte_ranges) > 1, 'file is split'
+    chunks = readers.from_file_by_chunks(EXAMPLE_FILENAME, chunk_bytes=30)
+    received = [i for c in chunks for i in c.get_list()]
+    assert received == readers.from_file(EXAMPLE_FILENAME).get_list(), 'chunks are aligned to line breaks'
+    received = readers.from_json_file_in_parallel(EXAMPLE_FILENAME, chunk_bytes=30, workers=2).get_list()
+    assert received == expected, 'from_json_file_in_parallel'
+    received = readers.from_file(EXAMPLE_FILENAME).parse_json(workers=2, chunk_size=3).get_list()
+    assert received == expected, 'parse_json in parallel'
+    received = readers.from_file_in_parallel(
+        EXAMPLE_FILENAME, readers.parse_json_lines,
+        to='RecordsFlux', skip_first_line=True, chunk_bytes=30, workers=2, executor='thread',
+    ).get_list()
+    assert received == expected[1:], 'skip_first_line'
+
+
+def test_read_by_index():
+    expected = [str(i) for i in EXAMPLE_INT_SEQUENCE]
+    readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).to_lines(
+    ).to_file(
+        EXAMPLE_FILENAME,
+        verbose=False,
+        return_flux=False,
+    )
+    index_filename = EXAMPLE_FILENAME + '.idx'
+    flux = readers.from_file(EXAMPLE_FILENAME, use_index=True)
+    assert os.path.exists(index_filename), 'index is stored next to file'
+    assert flux.count == len(expected), 'count from index'
+    received = flux.skip(3).take(2)
+    assert received.explain(show=False)[-2].strip() == 'slice of source: skip(3) -> take(2)', 'lines are sliced'
+    assert received.get_list() == expected[3:5], 'skip and take'
+    first, second = flux.split_by_pos(4)
+    assert first.get_list() == expected[:4] and second.get_list() == expected[4:], 'split_by_pos'
+    assert [f.get_list() for f in flux.split_by_list_pos([2, 5])] == [expected[:2], expected[2:5], expected[5:]]
+    with open(EXAMPLE_FILENAME, 'a') as fh:
+        fh.write('\nlast')
+    received = readers.from_file(EXAMPLE_FILENAME, use_index=True, skip_first_line=True).get_list()
+    assert received == expected[1:] + ['last'], 'index is rebuilt after change of file'
+    os.remove(index_filename)
+
+
+def test_write_by_batches():
+    expected = [str(i) for i in EXAMPLE_INT_SEQUENCE]
+    gz_filename = EXAMPLE_FILENAME + '.gz'
+    for filename in (EXAMPLE_FILENAME, gz_filename):
+        flux = readers.from_list(
+            EXAMPLE_INT_SEQUENCE,
+        ).to_lines(
+        ).to_file(
+            filename,
+            verbose=False,
+            batch_size=4,
+        )
+        assert flux.count == len(expected), 'count is known without reading of file'
+        assert flux.get_list() == expected, filename
+    os.remove(gz_filename)
+
+
+def test_from_parquet():
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    expected = [dict(n=n, x=i, y=str(i)) for n, i in enumerate(EXAMPLE_INT_SEQUENCE)]
+    table = pa.Table.from_pylist(expected)
+    assert readers.from_parquet(table, batch_size=4).get_list() == expected, 'from table'
+    filename = 'test_parquet.tmp'
+    pq.write_table(table, filename, row_group_size=3)
+    flux = readers.from_parquet(filename, columns=['n', 'x'], row_groups=[1, 2], batch_size=2)
+    assert flux.count == 6, 'count from metadata of row groups'
+    assert flux.get_list() == [dict(n=r['n'], x=r['x']) for r in expected[3:]], 'columns and row groups'
+    received = readers.from_parquet(
+        filename,
+        row_groups=lambda g: g.column(0).statistics.min >= 6,
+    ).get_list()
+    assert received == expected[6:], 'row groups filtered by statistics'
+    batches = readers.from_parquet(filename, as_batches=True, batch_size=4).get_list()
+    assert sum([b.num_rows for b in batches]) == len(expected), 'batches'
+    os.remove(filename)
+
+
+def test_columns_flux():
+    records = [dict(k=i % 3, v=float(i)) for i in EXAMPLE_INT_SEQUENCE]
+    columns = fx.RecordsFlux(records).to_columns(batch_size=4).to_memory()
+    assert columns.count == 3 and columns.get_rows_count() == len(records), 'batches'
+    assert columns.to_records().get_list() == records, 'to_records'
+    received = columns.filter(
+        lambda b: b['v'] > 4,
+    ).select(
+        'k', w=lambda b: b['v'] * 2,
+    ).to_records().get_list()
+    assert received == [dict(k=r['k'], w=r['v'] * 2) for r in records if r['v'] > 4], 'filter and select'
+    received = columns.sort('k', 'v').to_records().get_list()
+    assert received == sorted(records, key=lambda r: (r['k'], r['v'])), 'sort'
+    received = columns.aggregate('k', sum='v', count=True, max='v').to_records().get_list()
+    expected = [
+        dict(k=k, sum_v=sum(vs), count=len(vs), max_v=max(vs))
+        for k, vs in [(k, [r['v'] for r in records if r['k'] == k]) for k in range(3)]
+    ]
+    assert received == expected, 'aggregate'
+    dataframe = columns.get_dataframe()
+    assert dataframe['v'].tolist() == [r['v'] for r in records], 'get_dataframe'
+    assert fx.get_class(fx.FluxType.ColumnsFlux) == fx.ColumnsFlux and fx.is_flux(columns), 'flux type'
+    streaming = fx.RecordsFlux(iter(records)).to_columns(batch_size=4)
+    assert streaming.columns() == ['k', 'v'] and streaming.get_rows_count() == len(records), 'streaming batches'
+    assert streaming.to_records().get_list() == records, 'batches are not consumed by counting'
+    int_records = [dict(k=r['k'], v=int(r['v'])) for r in records]
+    received = fx.RecordsFlux(int_records).to_columns().aggregate('k', sum='v').to_records().get_list()
+    expected = fx.RecordsFlux(int_records).aggregate('k', sum='v').get_list()
+    assert sorted(received, key=str) == sorted(expected, key=str), 'sum of ints'
+    assert all([isinstance(r['sum_v'], int) for r in received]), 'sum of ints is int'
+    received = fx.RecordsFlux(int_records).to_columns().sort('k', reverse=True).to_records().get_list()
+    assert received == fx.RecordsFlux(int_records).sort('k', reverse=True).get_list(), 'stable reverse sort'
+    empty = fx.RecordsFlux([]).to_columns().aggregate('k', sum='v', count=True)
+    assert empty.columns() == ['k', 'sum_v', 'count'] and empty.to_records().get_list() == [], 'aggregate of empty'
+
+
+def test_compiled_selectors():
+    record = dict(a=1, b=2, c=None)
+    for descriptions in (
+        ('a', 'x'),
+        ('*', ('a', lambda r: 10), 'x'),
+        (('z', 'a', 'b', lambda a, b: a + b), ('w', 'z'), ('v', lambda r: r['z'])),
+        (('a', 'b'), 'a', '*'),
+    ):
+        expected = rf.select_fields(record, *descriptions)
+        received = rf.get_selector_function(*descriptions)(record)
+        assert list(received.items()) == list(expected.items()), descriptions
+    assert record == dict(a=1, b=2, c=None), 'input record is not changed'
+    row = (1, 2, 3)
+    for descriptions in ((2, 0), (1, '*'), (lambda r: r[0], (0, 1, lambda a, b: a - b))):
+        assert rw.get_selector_function(*descriptions)(row) == rw.select_columns(row, *descriptions), descriptions
+
+
+def test_parse_csv():
+    schema = [('id', 'int'), ('price', 'float'), ('name', 'str')]
+    lines = ['1,2.5,a', '2,,b', 'x,1.0,c', '4,3', '5,1e3,"d,e"', ',0,f']
+    expected = [[1, 2.5, 'a'], [5, 1000.0, 'd,e'], [0, 0.0, 'f']]
+    bad_rows = list()
+    flux = fx.LinesFlux(lines).parse_csv(schema, block_size=4, bad_rows=bad_rows)
+    assert flux.schema == schema, 'schema'
+    received = flux.get_list()
+    assert received == expected, 'casted rows'
+    assert [n for n, _, _ in bad_rows] == [1, 2, 3], 'bad rows'
+    assert received == fx.LinesFlux(
+        lines,
+    ).to_rows(
+    ).filter(
+        lambda r: r[0] not in ('2', 'x', '4'),
+    ).schematize(
+        schema,
+    ).get_list(), 'same as schematize'
+    try:
+        fx.LinesFlux(lines).parse_csv(schema).get_list()
+        raise AssertionError('ValueError expected')
+    except ValueError:
+        pass
+
+
+def test_sorted_join():
+    left = [(1, dict(a=1)), (2, dict(a=2)), (2, dict(a=22)), (4, dict(a=4))]
+    right = [(0, dict(b=0)), (2, dict(b=2)), (2, dict(b=3)), (4, dict(b=4))]
+    expected_inner = [
+        (2, dict(a=2, b=2)), (2, dict(a=2, b=3)), (2, dict(a=22, b=2)), (2, dict(a=22, b=3)),
+        (4, dict(a=4, b=4)),
+    ]
+    expected = dict(
+        inner=expected_inner,
+        left=[(1, dict(a=1))] + expected_inner,
+        outer=[(0, dict(b=0)), (1, dict(a=1))] + expected_inner,
+    )
+    for how, expected_pairs in expected.items():
+        received = fx.PairsFlux(left).sorted_join(fx.PairsFlux(right), how=how).get_list()
+        assert received == expected_pairs, how
+    received = fx.RecordsFlux(
+        [dict(k=k, **v) for k, v in left],
+    ).sorted_join(
+        fx.RecordsFlux([dict(k=k, **v) for k, v in right]),
+        'k',
+        how='inner',
+    ).get_list()
+    assert received == [dict(k=k, **v) for k, v in expected_inner], 'records'
+    mixed_left = [(1, 'x'), (2, [2]), (3, 'y')]
+    mixed_right = [(1, 'z'), (2, [3]), (4, 'w')]
+    for how in ('left', 'inner', 'outer'):
+        received = fx.PairsFlux(mixed_left).sorted_join(fx.PairsFlux(mixed_right), how=how).get_list()
+        expected_pairs = fx.PairsFlux(mixed_left).map_side_join(dict(mixed_right), how=how).get_list()
+        assert sorted(received, key=str) == sorted(expected_pairs, key=str), 'same merge as map_side_join: ' + how
+    assert dict(received) == {1: 'x', 2: [2, 3], 3: 'y', 4: 'w'}, 'scalar left value is kept'
+    received = fx.PairsFlux(mixed_left).sorted_join(fx.PairsFlux(mixed_right), how='right').get_list()
+    assert received == [(1, 'x'), (2, [2, 3]), (4, 'w')], 'right join of sorted_join() keeps right-only pairs'
+    try:
+        fx.PairsFlux(list(reversed(left))).sorted_join(right).get_list()
+        raise AssertionError('ValueError expected for unsorted items')
+    except ValueError:
+        pass
+
+
+def test_map_side_join_on_disk():
+    left = [(k, dict(a=k)) for k in EXAMPLE_INT_SEQUENCE + [10]]
+    right = [(k, dict(b=k * 10)) for k in EXAMPLE_INT_SEQUENCE[:5] + [11, 12]]
+    for how in ('left', 'inner', 'outer'):
+        expected = fx.PairsFlux(left).map_side_join(fx.PairsFlux(right), how=how).get_list()
+        assert len(expected) == dict(left=10, inner=5, outer=12)[how], how
+        for workers in (None, 2):
+            received = fx.PairsFlux(
+                [(k, dict(v)) for k, v in left],
+            ).map_side_join(
+                fx.PairsFlux(right),
+                how=how,
+                step=2,
+                partitions_count=3,
+                workers=workers,
+                verbose=False,
+            ).get_list()
+            message = '{} join with workers={}'.format(how, workers)
+            assert sorted(received, key=str) == sorted(expected, key=str), message
+            left_count = dict(left=10, inner=5, outer=10)[how]
+            assert received[:left_count] == expected[:left_count], message + ' keeps order of left pairs'
+
+
 def test_add():
     addition = list(reversed(EXAMPLE_INT_SEQUENCE))
     expected_1 = EXAMPLE_INT_SEQUENCE + addition
@@ -305,6 +690,55 @@ def test_split_by_func():
     assert received == expected
 
 
+def test_split_by_numeric_modes():
+    expected = [[3, 9, 6], [1, 7, 4], [5, 2, 8]]
+    calls = list()
+
+    def get_key(i):
+        calls.append(i)
+        return i % 3
+    received = [
+        f.get_list() for f in fx.AnyFlux(
+            EXAMPLE_INT_SEQUENCE,
+        ).split_by_numeric(get_key, 3)
+    ]
+    assert received == expected, 'memory mode'
+    assert calls == EXAMPLE_INT_SEQUENCE, 'key is calculated once for each item'
+    received = [
+        f.get_list() for f in fx.AnyFlux(
+            EXAMPLE_INT_SEQUENCE,
+        ).split_by_numeric(lambda i: i % 3, 3, mode='disk', step=2)
+    ]
+    assert received == expected, 'disk mode'
+    fluxes = fx.AnyFlux(EXAMPLE_INT_SEQUENCE).split_by_numeric(lambda i: i % 3, 3, mode='queue', max_buffered=2)
+    try:
+        fluxes[2].get_list()
+        raise AssertionError('BufferError expected')
+    except BufferError:
+        pass
+
+
+def test_to_partitioned_files():
+    records = [dict(shop_id=i % 3, n=n) for n, i in enumerate(EXAMPLE_INT_SEQUENCE)]
+    partitions = readers.from_list(records).to_records().to_partitioned_files(
+        'test_partition_{}.tmp', 'shop_id',
+        max_open_files=1,
+    )
+    assert list(partitions) == [1, 0, 2], 'partitions by value in order of first appearance'
+    for shop_id, flux in partitions.items():
+        expected = [r for r in records if r['shop_id'] == shop_id]
+        assert flux.count == len(expected), 'exact count'
+        assert flux.get_list() == expected, 'records of partition {}'.format(shop_id)
+    partitions = readers.from_list(records).to_records().to_partitioned_files(
+        'test_partition_{}.tmp', 'shop_id',
+        partitions_count=2,
+    )
+    assert [f.count for f in partitions] == [6, 3], 'partitions by hash of key'
+    assert sorted([r['n'] for f in partitions for r in f.get_list()]) == list(range(len(records))), 'all records'
+    for shop_id in range(3):
+        os.remove('test_partition_{}.tmp'.format(shop_id))
+
+
 def test_split_by_step():
     expected = [
         [1, 3, 5, 7],
@@ -328,6 +762,27 @@ def test_split_by_step():
     assert received_1 == expected, 'test case 1'
 
 
+def test_spill_formats():
+    example = [(1, 'a'), {2: [3.5, None]}, 'b']
+    for spill_format in spills.SpillFormat:
+        for compress in (False, True):
+            count = spills.dump_items(
+                example,
+                EXAMPLE_FILENAME,
+                spill_format=spill_format,
+                compress=compress,
+                frame_size=2,
+            )
+            received = list(
+                spills.load_items(EXAMPLE_FILENAME, spill_format=spill_format, compress=compress),
+            )
+            assert count == len(example), 'count for {}'.format(spill_format)
+            if spill_format == spills.SpillFormat.json:
+                assert received == [[1, 'a'], {'2': [3.5, None]}, 'b'], 'test case {}'.format(spill_format)
+            else:
+                assert received == example, 'test case {}'.format(spill_format)
+
+
 def test_memory_sort():
     expected = [7, 9, 8, 6, 5, 4, 3, 2, 1]
     received = readers.from_list(
@@ -339,8 +794,22 @@ def test_memory_sort():
     assert received == expected
 
 
+def test_merge_iter():
+    parts = [[(1, 'a'), (3, 'a')], [(1, 'b'), (2, 'b')], [(3, 'c')]]
+    expected_0 = [(1, 'a'), (1, 'b'), (2, 'b'), (3, 'a'), (3, 'c')]
+    received_0 = list(
+        af.merge_iter([iter(p) for p in parts], key_function=lambda i: i[0]),
+    )
+    assert received_0 == expected_0, 'test case 0'
+    expected_1 = [(3, 'a'), (3, 'c'), (2, 'b'), (1, 'a'), (1, 'b')]
+    received_1 = list(
+        af.merge_iter([iter(reversed(p)) for p in parts], key_function=lambda i: i[0], reverse=True),
+    )
+    assert received_1 == expected_1, 'test case 1'
+
+
 def test_disk_sort_by_key():
-    expected = [[k, str(k) * k] for k in range(1, 10)]
+    expected = [(k, str(k) * k) for k in range(1, 10)]
     received = readers.from_list(
         [(k, str(k) * k) for k in EXAMPLE_INT_SEQUENCE],
     ).to_pairs(
@@ -351,6 +820,56 @@ def test_disk_sort_by_key():
     assert received == expected
 
 
+def test_disk_sort_without_count():
+    spill_manager = spills.SpillManager('test_disk_sort_without_count_{}.tmp')
+    expected = list(range(1, 10))
+    sorted_flux = readers.iterable(
+        iter(EXAMPLE_INT_SEQUENCE),
+    ).disk_sort(
+        step=4,
+        spill_manager=spill_manager,
+    )
+    assert sorted_flux.count == len(expected), 'count'
+    assert sorted(os.listdir(spill_manager.path)) == [
+        'test_disk_sort_without_count_{}.tmp'.format(n) for n in range(3)
+    ], 'parts are spilled without pre-count'
+    tmp_path = spill_manager.path
+    received = sorted_flux.get_list()
+    assert received == expected, 'sorted items'
+    assert not os.path.exists(tmp_path), 'parts are removed'
+
+
+def test_disk_sort_in_parallel():
+    expected = [dict(x=k, y=-k) for k in reversed(range(1, 10))]
+    received = readers.from_list(
+        EXAMPLE_INT_SEQUENCE,
+    ).map_to_records(
+        lambda i: dict(x=i, y=-i),
+    ).sort(
+        'x',
+        reverse=True,
+        step=2,
+        workers=2,
+        verbose=False,
+    ).get_list()
+    assert received == expected
+
+
+def test_spill_manager_limit():
+    spill_manager = spills.SpillManager(max_bytes=100)
+    spill_manager.dump(EXAMPLE_INT_SEQUENCE)
+    tmp_path = spill_manager.path
+    try:
+        spill_manager.dump(range(1000))
+        raised = False
+    except OSError:
+        raised = True
+    assert raised, 'limit is exceeded'
+    assert os.listdir(tmp_path) == ['spill_0.tmp'], 'file over the limit is removed'
+    spill_manager.close()
+    assert not os.path.exists(tmp_path), 'directory is removed'
+
+
 def test_sort():
     expected_0 = list(reversed(range(1, 10)))
     received_0 = readers.from_list(
@@ -438,6 +957,53 @@ def test_group_by():
     assert received_1 == expected, 'test case 1'
 
 
+def test_hash_group_by():
+    example = [(3, 31), (1, 11), (2, 21), (3, 32), (1, 12), (3, 33)]
+    expected = [
+        (1, [11, 12]),
+        (2, [21]),
+        (3, [31, 32, 33]),
+    ]
+    for step in (None, 2):
+        received = readers.from_list(example).to_rows().to_records(
+            columns=('x', 'y'),
+        ).group_by(
+            'x',
+            step=step,
+            use_hash=True,
+            verbose=False,
+        ).map(
+            lambda a: (a[0], [i.get('y') for i in a[1]]),
+        ).get_list()
+        assert sorted(received) == expected, 'test case step={}'.format(step)
+
+
+def test_aggregate():
+    example = [(3, 31), (1, 11), (2, 21), (3, 32), (1, 12), (3, 33), (3, 32)]
+    expected = [
+        dict(x=1, count=2, sum_y=23, min_y=11, max_y=12, mean_y=11.5, mode_y=11),
+        dict(x=2, count=1, sum_y=21, min_y=21, max_y=21, mean_y=21.0, mode_y=21),
+        dict(x=3, count=4, sum_y=128, min_y=31, max_y=33, mean_y=32.0, mode_y=32),
+    ]
+    for use_hash in (False, True):
+        for step in (None, 2):
+            received = readers.from_list(example).to_rows().to_records(
+                columns=('x', 'y'),
+            ).aggregate(
+                'x',
+                use_hash=use_hash,
+                step=step,
+                verbose=False,
+                count='*',
+                sum='y',
+                min='y',
+                max='y',
+                mean='y',
+                mode='y',
+            ).get_list()
+            assert sorted(received, key=lambda r: r['x']) == expected, 'test case {}, {}'.format(use_hash, step)
+
+
 def test_calc_histogram():
     expected = [
         ('x', {1: 3, 9: 1}),
@@ -469,6 +1035,89 @@ def test_norm_text():
     assert received == expected
 
 
+def test_distinct_keys():
+    pairs = [(k % 4, [k] if k == 5 else k % 2) for k in EXAMPLE_INT_SEQUENCE]
+    expected_keys = [1, 3, 2, 0]
+    assert fx.PairsFlux(pairs).keys() == expected_keys
+    assert fx.PairsFlux(pairs).distinct_keys().get_list() == expected_keys
+    received = fx.PairsFlux(pairs).distinct_keys(step=2, tmp_file_template='test_distinct_keys_{}.tmp').get_list()
+    assert received == sorted(expected_keys)
+    assert fx.PairsFlux([]).distinct_keys(step=2).get_list() == []
+    expected_dict = {1: [1, [5]], 3: [1], 2: [0], 0: [0]}
+    assert fx.PairsFlux(pairs).get_dict(of_lists=True) == expected_dict
+
+
+def test_bloom_filter():
+    bloom_filter = bf.from_keys(range(1000), capacity=1000, error_rate=0.01)
+    assert all([k in bloom_filter for k in range(1000)])
+    false_positives = len([k for k in range(1000, 11000) if k in bloom_filter])
+    assert false_positives < 300, false_positives
+    assert bloom_filter.get_size_in_bytes() < 2 * 1000
+    filename = bloom_filter.save('test_bloom_filter.tmp')
+    loaded = bf.BloomFilter.load(filename)
+    assert len(loaded) == 1000
+    assert [k in loaded for k in range(1000, 11000)] == [k in bloom_filter for k in range(1000, 11000)]
+    os.remove(filename)
+    left = [(k, dict(a=k)) for k in range(100)]
+    right = [(k, dict(b=k)) for k in range(0, 100, 7)]
+    received = fx.PairsFlux(left).semi_join(fx.PairsFlux(right)).get_list()
+    assert set(range(0, 100, 7)) <= set([k for k, _ in received])
+    received = fx.PairsFlux(left).map_side_join(
+        fx.PairsFlux(right), how='inner', step=5, prefilter=True, verbose=False,
+    ).get_list()
+    expected = [(k, dict(a=k, b=k)) for k in range(0, 100, 7)]
+    assert sorted(received, key=str) == sorted(expected, key=str)
+    records = [dict(x=k % 10, y=k) for k in range(20)]
+    received = fx.RecordsFlux(records).semi_join(fx.RecordsFlux([dict(z=3), dict(z=5)]), 'x', right_keys=['z'])
+    assert [r['x'] for r in received.get_list()] == [3, 5, 3, 5]
+    bloom_filter = bf.from_keys([1.0, 2.5, (3, 'a'), None], capacity=4)
+    assert all([k in bloom_filter for k in (1, True, Decimal('1'), Decimal('2.5'), (3.0, 'a'), None)]), 'equal keys'
+    left = [(1, 'a'), (2, 'b')]
+    right = [(1.0, 'x'), (3.0, 'y')]
+    assert fx.PairsFlux(left).semi_join(fx.PairsFlux(right)).get_list() == [(1, 'a')], 'mixed numeric keys'
+    expected = fx.PairsFlux(left).map_side_join(fx.PairsFlux(right), how='inner').get_list()
+    received = fx.PairsFlux(left).map_side_join(
+        fx.PairsFlux(right), how='inner', step=1, prefilter=True, verbose=False,
+    ).get_list()
+    assert received == expected == [(1, 'a')], 'prefilter does not change result of join'
+    try:
+        fx.PairsFlux(iter(right)).get_bloom_filter()
+        raise AssertionError('ValueError expected for unknown count')
+    except ValueError:
+        pass
+    assert 1 in fx.PairsFlux(iter(right)).get_bloom_filter(capacity=10)
+
+
+def test_sample():
+    received = fx.AnyFlux(iter(range(1000))).sample(10, seed=1).get_list()
+    assert len(set(received)) == 10 and received == sorted(received), 'sample in order of source'
+    assert fx.AnyFlux(iter(range(5))).sample(10).get_list() == list(range(5))
+    hits = [0] * 20
+    for seed in range(300):
+        for i in fx.AnyFlux(iter(range(20))).sample(2, seed=seed).get_list():
+            hits[i] += 1
+    assert min(hits) > 10, 'each item can be sampled'
+    received = fx.AnyFlux(iter(range(10000))).sample_fraction(0.1, seed=2).get_list()
+    assert 800 < len(received) < 1200 and received == sorted(received)
+    assert fx.AnyFlux(list(range(100))).sample_fraction(1).get_list() == list(range(100))
+    assert fx.AnyFlux(list(range(100))).sample_fraction(0).get_list() == []
+    readers.from_list(range(100)).to_lines().to_file(EXAMPLE_FILENAME, verbose=False, return_flux=False)
+    lines = [str(i) for i in range(1, 100)]
+    expected = fx.LinesFlux(lines).sample(5, seed=3).get_list()
+    flux = readers.from_file(EXAMPLE_FILENAME, use_index=True, skip_first_line=True)
+    assert flux.sample(5, seed=3).get_list() == expected, 'lines are read from indexed file by positions'
+    expected = fx.LinesFlux(lines).sample_fraction(0.2, seed=4).get_list()
+    assert flux.sample_fraction(0.2, seed=4).get_list() == expected
+    expected = fx.LinesFlux(lines).sample_fraction(0.5, seed=4).get_list()
+    assert flux.sample_fraction(0.5, seed=4).get_list() == expected, 'dense sample is read in one pass'
+    assert list(flux.items.source[1:].read_positions([0, 5, 98])) == ['1', '6', '99'], 'lines by positions in slice'
+    os.remove(EXAMPLE_FILENAME + '.idx')
+    records = [dict(x=k % 3, y=k) for k in range(30)]
+    received = fx.RecordsFlux(records).stratified_sample('x', 2, seed=5).get_list()
+    assert sorted([r['x'] for r in received]) == [0, 0, 1, 1, 2, 2]
+    assert [r['y'] for r in received] == sorted([r['y'] for r in received])
+
+
 def test_sum_by_keys():
     expected = [((2, 1), {'h': 3}), ((4, 3), {'h': 5})]
     received = readers.from_list(
@@ -514,24 +1163,49 @@ if __name__ == '__main__':
     test_map()
     test_flat_map()
     test_filter()
+    test_parallel_map_and_filter()
+    test_lazy_in_memory_steps()
+    test_pipeline_plan()
     test_take()
     test_skip()
     test_map_filter_take()
     test_enumerated()
     test_save_and_read()
+    test_read_without_count()
+    test_read_in_parallel()
+    test_read_by_index()
+    test_write_by_batches()
+    test_from_parquet()
+    test_columns_flux()
+    test_compiled_selectors()
+    test_parse_csv()
+    test_sorted_join()
+    test_map_side_join_on_disk()
     test_add()
     test_add_records()
     test_separate_first()
     test_split_by_pos()
     test_split_by_func()
+    test_split_by_numeric_modes()
+    test_to_partitioned_files()
     test_split_by_step()
+    test_spill_formats()
     test_memory_sort()
+    test_merge_iter()
     test_disk_sort_by_key()
+    test_disk_sort_without_count()
+    test_disk_sort_in_parallel()
+    test_spill_manager_limit()
     test_sort()
     test_sorted_group_by_key()
     test_group_by()
+    test_hash_group_by()
+    test_aggregate()
     test_calc_histogram()
     test_norm_text()
+    test_distinct_keys()
+    test_bloom_filter()
+    test_sample()
     test_sum_by_keys()
     test_to_rows()
     test_parse_json()
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from itertools import islice
+from zlib import crc32
+import gzip
+
+
+DEFAULT_MAX_OPEN_FILES = 64
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 10000  # lines joined into one block before writing
+GZIP_COMPRESS_LEVEL = 6
+
+
+def open_for_write(filename, encoding=None, gz=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    if gz is None:
+        gz = filename.endswith('.gz')
+    if gz:
+        return gzip.open(filename, 'wt', encoding=encoding, compresslevel=GZIP_COMPRESS_LEVEL)
+    else:
+        return open(filename, 'w', encoding=encoding, buffering=buffer_size)
+
+
+def get_batches(items, batch_size=DEFAULT_BATCH_SIZE):
+    iterator = iter(items)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
+
+
+def write_lines(lines, filename, encoding=None, end='\n', gz=None, batch_size=DEFAULT_BATCH_SIZE):
+    # joins batches of lines into blocks and writes each block by one call, returns count of lines
+    count = 0
+    with open_for_write(filename, encoding, gz) as fh:
+        for batch in get_batches(lines, batch_size):
+            fh.write((end if count else '') + end.join(map(str, batch)))
+            count += len(batch)
+    return count
+
+
+def write_and_yield_lines(
+        lines, filename,
+        encoding=None, end='\n', gz=None, batch_size=DEFAULT_BATCH_SIZE,
+        verbose=False,
+):
+    # same as write_lines() but lazy: lines are yielded and written by batches while flux is iterated
+    # if consumer stops early, consumed lines of pending batch are written when generator is closed
+    count = 0
+    with open_for_write(filename, encoding, gz) as fh:
+        batch = list()
+        try:
+            for i in lines:
+                batch.append(str(i))
+                yield i
+                if len(batch) >= batch_size:
+                    fh.write((end if count else '') + end.join(batch))
+                    count += len(batch)
+                    batch = list()
+        finally:
+            if batch:
+                fh.write((end if count else '') + end.join(batch))
+                count += len(batch)
+    if verbose:
+        print('Done. {} rows has written into {}'.format(count, filename))
+
+
+def get_stable_hash(key):
+    # unlike hash() it does not depend on PYTHONHASHSEED, so partitions are the same in each run
+    return key if isinstance(key, int) else crc32(str(key).encode('utf8'))
+
+
+class WriterPool:
+    # keeps not more than max_open_files buffered files open, least recently used file is closed first
+    # and reopened for append on next write
+    def __init__(self, max_open_files=DEFAULT_MAX_OPEN_FILES, encoding=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.max_open_files = max_open_files
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.open_files = OrderedDict()
+        self.counts = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_fileholder(self, filename):
+        fileholder = self.open_files.get(filename)
+        if fileholder is not None:
+            self.open_files.move_to_end(filename)
+            return fileholder
+        if len(self.open_files) >= self.max_open_files:
+            _, least_used = self.open_files.popitem(last=False)
+            least_used.close()
+        mode = 'a' if filename in self.counts else 'w'
+        fileholder = open(filename, mode, encoding=self.encoding, buffering=self.buffer_size)
+        self.open_files[filename] = fileholder
+        self.counts.setdefault(filename, 0)
+        return fileholder
+
+    def write(self, filename, line, end='\n'):
+        self.get_fileholder(filename).write(line + end)
+        self.counts[filename] += 1
+
+    def touch(self, filename):
+        if filename not in self.counts:
+            self.get_fileholder(filename)
+
+    def close(self):
+        while self.open_files:
+            _, fileholder = self.open_files.popitem()
+            fileholder.close()
+
+
+def write_partitions(
+        items, key_function, template,
+        partitions_count=None, to_line=str,
+        max_open_files=DEFAULT_MAX_OPEN_FILES, encoding=None,
+):
+    # writes items in one pass into files by key: template is formatted by number of partition (stable hash of key)
+    # or by value of key if partitions_count is not set, returns dict of partition: (filename, count)
+    partitions = OrderedDict()
+    with WriterPool(max_open_files, encoding) as pool:
+        if partitions_count:
+            for n in range(partitions_count):
+                partitions[n] = template.format(n)
+                pool.touch(partitions[n])
+        for i in items:
+            key = key_function(i)
+            partition = get_stable_hash(key) % partitions_count if partitions_count else key
+            filename = partitions.get(partition)
+            if filename is None:
+                filename = template.format(partition)
+                partitions[partition] = filename
+            pool.write(filename, to_line(i))
+        return OrderedDict([(p, (f, pool.counts.get(f, 0))) for p, f in partitions.items()])